@@ -5,24 +5,63 @@ With COP calculation, energy stats, and historical data
 Supports SQLite (local) and PostgreSQL (Railway)
 """
 
-from flask import Flask, render_template_string, jsonify, request, redirect, url_for, session, flash
+from flask import Flask, Response, abort, render_template, request, redirect, url_for, session, flash
+from flask.json.provider import JSONProvider
+import gzip
+import io
+import logging
 import os
+import queue
+import re
 import threading
 import time
 import secrets
+import weakref
 import hashlib
+import hmac
 import smtplib
+import struct
+import sys
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from datetime import datetime, timedelta
-from functools import wraps
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from functools import wraps, lru_cache
+from itertools import chain
+from dataclasses import dataclass
+import brotli
+import orjson
+import rcssmin
+import rjsmin
 from dotenv import load_dotenv
 from perifal_client import PerifalClient
 
 load_dotenv()
 
+# PerifalClient reports through the "perifal" logger; print it alongside our own output
+logging.basicConfig(stream=sys.stdout, format="%(message)s")
+logging.getLogger("perifal").setLevel(logging.INFO)
+
+class OrjsonProvider(JSONProvider):
+    """app.json on orjson, so jsonify(), request.get_json() and the session
+    cookie use the same encoder as json_response()"""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 app.secret_key = os.getenv("SECRET_KEY", secrets.token_hex(32))
+# Session cookies are not sent on cross-site POSTs, e.g. forged /api/control forms
+app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
+
+# Pump control is unlocked per session with this password, never sent to browsers
+CONTROL_PASSWORD = os.getenv("CONTROL_PASSWORD", "Mb29661")
+CONTROL_UNLOCK_SECONDS = 300
 
 # Email configuration
 SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.gmail.com")
@@ -32,6 +71,12 @@ SMTP_PASSWORD = os.getenv("SMTP_PASSWORD", "")
 ADMIN_EMAIL = os.getenv("ADMIN_EMAIL", "martin@strandholm.com")
 APP_URL = os.getenv("APP_URL", "https://web-production-3bb0d.up.railway.app")
 
+# SMTP is slow; send mail off the request thread
+EMAIL_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="email")
+
+# Cloud history series are fetched one request per address; shared so requests don't spawn threads
+HISTORY_POOL = ThreadPoolExecutor(max_workers=5, thread_name_prefix="history")
+
 # Credentials
 USERNAME = os.getenv("PERIFAL_USERNAME")
 PASSWORD = os.getenv("PERIFAL_PASSWORD")
@@ -43,15 +88,29 @@ if DATABASE_URL:
     # Railway PostgreSQL
     import psycopg2
     from psycopg2.extras import RealDictCursor
+    from psycopg2.pool import ThreadedConnectionPool
     USE_POSTGRES = True
     # Fix Railway's postgres:// URL to postgresql://
     if DATABASE_URL.startswith("postgres://"):
         DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
+    # Reuse connections instead of a TCP+TLS+auth handshake per query
+    DB_POOL = ThreadedConnectionPool(1, int(os.getenv("DB_POOL_MAX", 10)), DATABASE_URL)
 else:
     # Local SQLite
     import sqlite3
     USE_POSTGRES = False
     DB_PATH = os.path.join(os.path.dirname(__file__), 'perifal_history.db')
+    # Per-connection tuning for a read-mostly, append-only workload.
+    # synchronous=NORMAL is safe under WAL; mmap serves reads from the OS page cache.
+    SQLITE_PRAGMAS = (
+        "PRAGMA synchronous=NORMAL",
+        "PRAGMA temp_store=MEMORY",
+        "PRAGMA mmap_size=268435456",
+        "PRAGMA cache_size=-20000",
+        "PRAGMA wal_autocheckpoint=1000",
+    )
+    # Idle connections kept open between requests, like DB_POOL on PostgreSQL
+    SQLITE_POOL = queue.LifoQueue(maxsize=int(os.getenv("DB_POOL_MAX", 10)))
 
 # All parameters to fetch
 # T01=Inkommande vatten, T02=Utgående vatten, T03=Förångargastemp, T04=Utomhustemp
@@ -60,7 +119,7 @@ else:
 # T33=IPM larmtemp, T34=AC spänning, T35=AC ström, T36=Kompressor fasström
 # T37=DC styrspänning, T38=IPM temp, T39=Vattenflöde, T45=Högtryck
 # T49=Förångargastemp, T50=Underkylning, T51=Överhettning, T52-54=Ström L1-L3
-ALL_PARAMS = [
+ALL_PARAMS = (
     "Power", "Mode", "ModeState",
     # Temperaturer
     "T01", "T02", "T03", "T04", "T05", "T06", "T07", "T08", "T09",
@@ -85,130 +144,186 @@ ALL_PARAMS = [
     "CP1-1", "CP1-2", "CP1-3", "CP1-4", "CP1-5", "CP1-6", "CP1-7",
     # Zone 2
     "Zone 2 Curve Offset", "Zone 2 Cure Slope", "Zone 2 Water Target",
-]
+)
+
+# Numeric inputs of log_reading(), in unpacking order
+# 2054 = Electrical power (kW), T39 = Flow rate (m³/h)
+READING_KEYS = ("T01", "T02", "T04", "T06", "T12", "T33", "T39", "2054")
 
 # ============== Database Functions ==============
 
 def get_db_connection():
-    """Get database connection (PostgreSQL or SQLite)"""
+    """Get database connection (PostgreSQL or SQLite)
+
+    Always hand the connection back with release_db_connection().
+    """
     if USE_POSTGRES:
-        conn = psycopg2.connect(DATABASE_URL)
-        return conn
+        return DB_POOL.getconn()
     else:
-        conn = sqlite3.connect(DB_PATH)
+        try:
+            return SQLITE_POOL.get_nowait()
+        except queue.Empty:
+            pass
+        # Pooled connections move between threads, but only one uses a connection at a time
+        conn = sqlite3.connect(DB_PATH, timeout=30, check_same_thread=False)
         conn.row_factory = sqlite3.Row
+        for pragma in SQLITE_PRAGMAS:
+            conn.execute(pragma)
         return conn
 
+def release_db_connection(conn):
+    """Return a connection to the pool"""
+    if conn is None:
+        return
+    if USE_POSTGRES:
+        # The pool rolls back any transaction left open by a failed query
+        DB_POOL.putconn(conn)
+    else:
+        conn.rollback()
+        try:
+            SQLITE_POOL.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
 def init_db():
     """Initialize database tables"""
-    conn = get_db_connection()
-    cur = conn.cursor()
+    conn = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
 
-    if USE_POSTGRES:
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS readings (
-                id SERIAL PRIMARY KEY,
-                timestamp TIMESTAMP NOT NULL,
-                t01_return REAL,
-                t02_flow REAL,
-                t04_outdoor REAL,
-                t06_tank REAL,
-                t12_compressor REAL,
-                t33_comp_freq REAL,
-                t39_power_kw REAL,
-                d12_flow_rate REAL,
-                cop_calculated REAL,
-                heat_power_kw REAL,
-                mode VARCHAR(10),
-                UNIQUE(timestamp)
-            )
-        ''')
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id SERIAL PRIMARY KEY,
-                email VARCHAR(255) NOT NULL UNIQUE,
-                password_hash VARCHAR(255) NOT NULL,
-                name VARCHAR(255),
-                email_verified BOOLEAN DEFAULT FALSE,
-                admin_approved BOOLEAN DEFAULT FALSE,
-                is_admin BOOLEAN DEFAULT FALSE,
-                verification_token VARCHAR(255),
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-    else:
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS readings (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp TEXT NOT NULL UNIQUE,
-                t01_return REAL,
-                t02_flow REAL,
-                t04_outdoor REAL,
-                t06_tank REAL,
-                t12_compressor REAL,
-                t33_comp_freq REAL,
-                t39_power_kw REAL,
-                d12_flow_rate REAL,
-                cop_calculated REAL,
-                heat_power_kw REAL,
-                mode TEXT
-            )
-        ''')
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                email TEXT NOT NULL UNIQUE,
-                password_hash TEXT NOT NULL,
-                name TEXT,
-                email_verified INTEGER DEFAULT 0,
-                admin_approved INTEGER DEFAULT 0,
-                is_admin INTEGER DEFAULT 0,
-                verification_token TEXT,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-    # New table for raw parameter storage (all parameters with original names)
-    if USE_POSTGRES:
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS readings_raw (
-                id SERIAL PRIMARY KEY,
-                timestamp TIMESTAMP NOT NULL,
-                parameter VARCHAR(50) NOT NULL,
-                value REAL,
-                UNIQUE(timestamp, parameter)
-            )
-        ''')
-        cur.execute('CREATE INDEX IF NOT EXISTS idx_readings_raw_param ON readings_raw(parameter, timestamp)')
-    else:
-        cur.execute('''
-            CREATE TABLE IF NOT EXISTS readings_raw (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp TEXT NOT NULL,
-                parameter TEXT NOT NULL,
-                value REAL,
-                UNIQUE(timestamp, parameter)
-            )
-        ''')
-        cur.execute('CREATE INDEX IF NOT EXISTS idx_readings_raw_param ON readings_raw(parameter, timestamp)')
-
-    conn.commit()
-    conn.close()
+        if not USE_POSTGRES:
+            # WAL lets API readers run concurrently with the logger's writes.
+            # The journal mode is persistent, so setting it once here is enough.
+            cur.execute("PRAGMA journal_mode=WAL")
+
+        if USE_POSTGRES:
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS readings (
+                    id SERIAL PRIMARY KEY,
+                    timestamp TIMESTAMP NOT NULL,
+                    t01_return REAL,
+                    t02_flow REAL,
+                    t04_outdoor REAL,
+                    t06_tank REAL,
+                    t12_compressor REAL,
+                    t33_comp_freq REAL,
+                    t39_power_kw REAL,
+                    d12_flow_rate REAL,
+                    cop_calculated REAL,
+                    heat_power_kw REAL,
+                    mode VARCHAR(10),
+                    UNIQUE(timestamp)
+                )
+            ''')
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS users (
+                    id SERIAL PRIMARY KEY,
+                    email VARCHAR(255) NOT NULL UNIQUE,
+                    password_hash VARCHAR(255) NOT NULL,
+                    name VARCHAR(255),
+                    email_verified BOOLEAN DEFAULT FALSE,
+                    admin_approved BOOLEAN DEFAULT FALSE,
+                    is_admin BOOLEAN DEFAULT FALSE,
+                    verification_token VARCHAR(255),
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+        else:
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS readings (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    timestamp TEXT NOT NULL UNIQUE,
+                    t01_return REAL,
+                    t02_flow REAL,
+                    t04_outdoor REAL,
+                    t06_tank REAL,
+                    t12_compressor REAL,
+                    t33_comp_freq REAL,
+                    t39_power_kw REAL,
+                    d12_flow_rate REAL,
+                    cop_calculated REAL,
+                    heat_power_kw REAL,
+                    mode TEXT
+                )
+            ''')
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS users (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    email TEXT NOT NULL UNIQUE,
+                    password_hash TEXT NOT NULL,
+                    name TEXT,
+                    email_verified INTEGER DEFAULT 0,
+                    admin_approved INTEGER DEFAULT 0,
+                    is_admin INTEGER DEFAULT 0,
+                    verification_token TEXT,
+                    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+
+        # New table for raw parameter storage (all parameters with original names)
+        if USE_POSTGRES:
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS readings_raw (
+                    id SERIAL PRIMARY KEY,
+                    timestamp TIMESTAMP NOT NULL,
+                    parameter VARCHAR(50) NOT NULL,
+                    value REAL,
+                    UNIQUE(timestamp, parameter)
+                )
+            ''')
+            cur.execute('CREATE INDEX IF NOT EXISTS idx_readings_raw_param ON readings_raw(parameter, timestamp)')
+        else:
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS readings_raw (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    timestamp TEXT NOT NULL,
+                    parameter TEXT NOT NULL,
+                    value REAL,
+                    UNIQUE(timestamp, parameter)
+                )
+            ''')
+            cur.execute('CREATE INDEX IF NOT EXISTS idx_readings_raw_param ON readings_raw(parameter, timestamp)')
+
+        # Covering index for get_local_history(): the range scan on timestamp is
+        # answered from the index alone. UNIQUE(timestamp) already serves MIN/MAX.
+        if USE_POSTGRES:
+            cur.execute('''
+                CREATE INDEX IF NOT EXISTS idx_readings_ts_cov ON readings(timestamp)
+                INCLUDE (t01_return, t02_flow, t04_outdoor, t06_tank, t39_power_kw, cop_calculated)
+            ''')
+        else:
+            cur.execute('''
+                CREATE INDEX IF NOT EXISTS idx_readings_ts_cov ON readings(timestamp,
+                    t01_return, t02_flow, t04_outdoor, t06_tank, t39_power_kw, cop_calculated)
+            ''')
+
+        conn.commit()
+    finally:
+        release_db_connection(conn)
     print("Database initialized", flush=True)
 
 # ============== User Authentication Functions ==============
 
+# PBKDF2 runs in OpenSSL (SHA-NI where available) and releases the GIL
+PBKDF2_ITERATIONS = 100_000
+
 def hash_password(password):
-    """Hash a password with salt"""
-    salt = secrets.token_hex(16)
-    pwd_hash = hashlib.sha256((password + salt).encode()).hexdigest()
-    return f"{salt}:{pwd_hash}"
+    """Hash a password with PBKDF2-SHA256 and a random salt"""
+    salt = secrets.token_bytes(16)
+    dk = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, PBKDF2_ITERATIONS)
+    return f"pbkdf2_sha256${PBKDF2_ITERATIONS}${salt.hex()}${dk.hex()}"
 
 def verify_password(password, stored_hash):
-    """Verify a password against stored hash"""
+    """Verify a password against stored hash (PBKDF2 or legacy salted SHA-256)"""
     try:
+        if stored_hash.startswith('pbkdf2_sha256$'):
+            _, iterations, salt, pwd_hash = stored_hash.split('$')
+            dk = hashlib.pbkdf2_hmac('sha256', password.encode(), bytes.fromhex(salt), int(iterations))
+            return hmac.compare_digest(dk.hex(), pwd_hash)
+        # Legacy format "salt:sha256(password + salt)"
         salt, pwd_hash = stored_hash.split(':')
-        return hashlib.sha256((password + salt).encode()).hexdigest() == pwd_hash
+        return hmac.compare_digest(hashlib.sha256((password + salt).encode()).hexdigest(), pwd_hash)
     except:
         return False
 
@@ -239,38 +354,38 @@ def send_email(to_email, subject, html_body):
 def create_user(email, password, name):
     """Create a new user"""
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-
         password_hash = hash_password(password)
         verification_token = secrets.token_urlsafe(32)
 
-        if USE_POSTGRES:
-            cur.execute('''
-                INSERT INTO users (email, password_hash, name, verification_token)
-                VALUES (%s, %s, %s, %s) RETURNING id
-            ''', (email.lower(), password_hash, name, verification_token))
-            user_id = cur.fetchone()[0]
-        else:
-            cur.execute('''
-                INSERT INTO users (email, password_hash, name, verification_token)
-                VALUES (?, ?, ?, ?)
-            ''', (email.lower(), password_hash, name, verification_token))
-            user_id = cur.lastrowid
-
-        conn.commit()
-        conn.close()
+        conn = get_db_connection()
+        try:
+            cur = conn.cursor()
+            if USE_POSTGRES:
+                cur.execute('''
+                    INSERT INTO users (email, password_hash, name, verification_token)
+                    VALUES (%s, %s, %s, %s) RETURNING id
+                ''', (email.lower(), password_hash, name, verification_token))
+                user_id = cur.fetchone()[0]
+            else:
+                cur.execute('''
+                    INSERT INTO users (email, password_hash, name, verification_token)
+                    VALUES (?, ?, ?, ?)
+                ''', (email.lower(), password_hash, name, verification_token))
+                user_id = cur.lastrowid
+            conn.commit()
+        finally:
+            release_db_connection(conn)
 
         # Send verification email
         verify_url = f"{APP_URL}/verify/{verification_token}"
-        send_email(email, "Verifiera din e-post - Perifal LV-418",
+        EMAIL_POOL.submit(send_email, email, "Verifiera din e-post - Perifal LV-418",
             f"""<h2>Välkommen till Perifal LV-418 Dashboard!</h2>
             <p>Klicka på länken nedan för att verifiera din e-postadress:</p>
             <p><a href="{verify_url}">{verify_url}</a></p>
             <p>Efter verifiering måste en administratör godkänna ditt konto.</p>""")
 
         # Notify admin
-        send_email(ADMIN_EMAIL, "Ny användare väntar på godkännande - Perifal LV-418",
+        EMAIL_POOL.submit(send_email, ADMIN_EMAIL, "Ny användare väntar på godkännande - Perifal LV-418",
             f"""<h2>Ny registrering</h2>
             <p><strong>Namn:</strong> {name}</p>
             <p><strong>E-post:</strong> {email}</p>
@@ -283,6 +398,7 @@ def create_user(email, password, name):
 
 def get_user_by_email(email):
     """Get user by email"""
+    conn = None
     try:
         conn = get_db_connection()
         cur = conn.cursor()
@@ -293,7 +409,6 @@ def get_user_by_email(email):
             cur.execute('SELECT * FROM users WHERE email = ?', (email.lower(),))
 
         row = cur.fetchone()
-        conn.close()
 
         if row:
             if USE_POSTGRES:
@@ -305,9 +420,38 @@ def get_user_by_email(email):
     except Exception as e:
         print(f"Get user error: {e}", flush=True)
         return None
+    finally:
+        release_db_connection(conn)
+
+# Shape check only; rejects junk before it costs a database round-trip
+EMAIL_RE = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+
+# Users found by login lookups, kept briefly so repeated attempts skip the database
+USER_CACHE_SECONDS = 30
+USER_CACHE_MAX = 1024
+_user_cache = {}  # email -> (expires, user)
+
+def get_user_for_login(email):
+    """get_user_by_email() for the login form; only found users are cached"""
+    email = email.lower()
+    now = time.monotonic()
+    entry = _user_cache.get(email)
+    if entry and entry[0] > now:
+        return entry[1]
+    user = get_user_by_email(email)
+    if user:
+        if len(_user_cache) >= USER_CACHE_MAX:
+            _user_cache.clear()
+        _user_cache[email] = (now + USER_CACHE_SECONDS, user)
+    return user
+
+def invalidate_user_cache():
+    """Forget cached users, e.g. after a verification or approval changed a row"""
+    _user_cache.clear()
 
 def ensure_admin_exists():
     """Create initial admin user if no users exist"""
+    conn = None
     try:
         conn = get_db_connection()
         cur = conn.cursor()
@@ -318,16 +462,12 @@ def ensure_admin_exists():
             cur.execute('SELECT COUNT(*) FROM users')
 
         count = cur.fetchone()[0]
-        conn.close()
 
         if count == 0:
             # Create initial admin
             admin_email = os.getenv("ADMIN_EMAIL", "martin@strandholm.com")
             admin_password = os.getenv("ADMIN_PASSWORD", "admin123")  # Should be changed!
 
-            conn = get_db_connection()
-            cur = conn.cursor()
-
             password_hash = hash_password(admin_password)
 
             if USE_POSTGRES:
@@ -342,10 +482,11 @@ def ensure_admin_exists():
                 ''', (admin_email.lower(), password_hash, 'Admin'))
 
             conn.commit()
-            conn.close()
             print(f"Created initial admin user: {admin_email}", flush=True)
     except Exception as e:
         print(f"Ensure admin error: {e}", flush=True)
+    finally:
+        release_db_connection(conn)
 
 def login_required(f):
     """Decorator to require login"""
@@ -367,74 +508,37 @@ def admin_required(f):
 
 # ============== Cloud Data Import ==============
 
-def import_cloud_history():
-    """Import historical data from cloud to fill database"""
-    try:
-        print("Importing cloud history to database...", flush=True)
-        client = PerifalClient(USERNAME, PASSWORD)
-        if not client.login():
-            print("Failed to login for cloud import", flush=True)
-            return 0
-
-        end_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        start_time = (datetime.now() - timedelta(hours=72)).strftime('%Y-%m-%d %H:%M:%S')
-
-        # Fetch cloud data
-        flow_data = client.get_history(DEVICE_CODE, "2046", start_time, end_time, "day")
-        tank_data = client.get_history(DEVICE_CODE, "2047", start_time, end_time, "day")
-        outdoor_data = client.get_history(DEVICE_CODE, "2048", start_time, end_time, "day")
-        power_data = client.get_history(DEVICE_CODE, "2054", start_time, end_time, "day")
-
-        flow_values = flow_data.get('valueList', []) if isinstance(flow_data, dict) else []
-        tank_values = tank_data.get('valueList', []) if isinstance(tank_data, dict) else []
-        outdoor_values = outdoor_data.get('valueList', []) if isinstance(outdoor_data, dict) else []
-        power_values = power_data.get('valueList', []) if isinstance(power_data, dict) else []
-
-        flow_by_time = {v['dateTime']: float(v['addressValue']) for v in flow_values}
-        tank_by_time = {v['dateTime']: float(v['addressValue']) for v in tank_values}
-        outdoor_by_time = {v['dateTime']: float(v['addressValue']) for v in outdoor_values}
-        power_by_time = {v['dateTime']: float(v['addressValue']) for v in power_values}
-
-        all_times = set(flow_by_time.keys()) | set(tank_by_time.keys()) | set(outdoor_by_time.keys())
-
-        conn = get_db_connection()
-        cur = conn.cursor()
-        imported = 0
-
-        for dt_str in all_times:
-            try:
-                timestamp = datetime.strptime(dt_str, '%Y-%m-%d %H')
-                t02 = flow_by_time.get(dt_str)
-                t06 = tank_by_time.get(dt_str)
-                t04 = outdoor_by_time.get(dt_str)
-                t39 = power_by_time.get(dt_str)
-
-                if USE_POSTGRES:
-                    cur.execute('''
-                        INSERT INTO readings (timestamp, t02_flow, t06_tank, t04_outdoor, t39_power_kw)
-                        VALUES (%s, %s, %s, %s, %s)
-                        ON CONFLICT (timestamp) DO NOTHING
-                    ''', (timestamp, t02, t06, t04, t39))
-                else:
-                    cur.execute('''
-                        INSERT OR IGNORE INTO readings (timestamp, t02_flow, t06_tank, t04_outdoor, t39_power_kw)
-                        VALUES (?, ?, ?, ?, ?)
-                    ''', (timestamp.isoformat(), t02, t06, t04, t39))
-
-                imported += 1
-            except:
-                continue
+# Cloud client shared by the background logger and the history import,
+# so the auth token survives between logger ticks
+_shared_client = None
+_shared_client_lock = threading.Lock()
 
-        conn.commit()
-        conn.close()
-        print(f"Imported {imported} readings from cloud", flush=True)
-        return imported
-    except Exception as e:
-        print(f"Cloud import error: {e}", flush=True)
-        return 0
+def get_shared_client():
+    """Return the shared logged-in PerifalClient, or None if login fails"""
+    global _shared_client
+    with _shared_client_lock:
+        if _shared_client is None:
+            client = PerifalClient(USERNAME, PASSWORD)
+            if not client.login():
+                return None
+            _shared_client = client
+        return _shared_client
+
+def reset_shared_client():
+    """Drop the shared client so the next use logs in again"""
+    global _shared_client
+    with _shared_client_lock:
+        _shared_client = None
+
+def parse_cloud_hour(dt_str):
+    """Parse a cloud history time "YYYY-MM-DD HH" (much faster than strptime)"""
+    if len(dt_str) != 13 or dt_str[4] != '-' or dt_str[7] != '-' or dt_str[10] != ' ':
+        raise ValueError(f"Unexpected cloud time format: {dt_str!r}")
+    return datetime(int(dt_str[0:4]), int(dt_str[5:7]), int(dt_str[8:10]), int(dt_str[11:13]))
 
 def log_reading_raw(params, timestamp=None):
     """Log ALL parameters to readings_raw table with original names"""
+    conn = None
     try:
         conn = get_db_connection()
         cur = conn.cursor()
@@ -469,94 +573,102 @@ def log_reading_raw(params, timestamp=None):
                 count += 1
 
         conn.commit()
-        conn.close()
         return count
     except Exception as e:
         print(f"Error logging raw reading: {e}", flush=True)
         return 0
+    finally:
+        release_db_connection(conn)
+
+# Estimated flow for LV-418 when no T39 measurement is available (cloud/raw history)
+ESTIMATED_FLOW_M3H = 2.0
+
+def calculate_cop(t01, t02, flow_m3h, power_kw):
+    """Return (heat power kW, COP) - COP is None below 0.1 kW input, capped at 5.0"""
+    flow_lmin = flow_m3h * 1000 / 60  # m³/h to l/min
+    # Q = flow (l/min) * deltaT (°C) * 4.186 (kJ/kg·K) / 60 (s/min) = kW
+    heat_power = (flow_lmin * (t02 - t01) * 4.186) / 60 if flow_lmin > 0 else 0
+    cop = min(heat_power / power_kw, 5.0) if power_kw > 0.1 else None  # Max COP 5.0
+    return heat_power, cop
+
+# PostgreSQL connections that already have the log_reading_ins statement prepared
+# (SQLite's driver caches compiled statements on its own)
+_log_reading_prepared = weakref.WeakSet()
 
 def log_reading(params):
     """Log a reading to the database (both old format and new raw format)"""
+    conn = None
     try:
         # Log to new raw table with all parameters
         raw_count = log_reading_raw(params)
 
-        conn = get_db_connection()
-        cur = conn.cursor()
-
-        # Calculate COP - 2054 = power (kW), T39 = flow (m³/h)
-        power_kw = float(params.get('2054', 0) or 0)  # 2054 = Electrical power kW
-        t39 = float(params.get('T39', 0) or 0)  # Flow rate m³/h
-        t02 = float(params.get('T02', 0) or 0)
-        t01 = float(params.get('T01', 0) or 0)
+        # Convert every numeric input exactly once, in one pass
+        t01, t02, t04, t06, t12, t33, t39, power_kw = [
+            float(params.get(k, 0) or 0) for k in READING_KEYS
+        ]
 
-        delta_t = t02 - t01
-        flow_lmin = t39 * 1000 / 60  # m³/h to l/min
-        heat_power = (flow_lmin * delta_t * 4.186) / 60 if flow_lmin > 0 else 0
-        cop = min(heat_power / power_kw, 5.0) if power_kw > 0.1 else None  # Max COP 5.0
+        heat_power, cop = calculate_cop(t01, t02, t39, power_kw)
 
         timestamp = datetime.now().replace(minute=0, second=0, microsecond=0)
+        values = (
+            timestamp if USE_POSTGRES else timestamp.isoformat(),
+            t01, t02, t04, t06, t12, t33,
+            power_kw,  # Power kW (stored in t39_power_kw column)
+            t39,  # Flow m³/h (stored in d12_flow_rate column)
+            cop,
+            heat_power,
+            params.get('Mode', '')
+        )
+
+        conn = get_db_connection()
+        cur = conn.cursor()
 
         if USE_POSTGRES:
-            cur.execute('''
-                INSERT INTO readings (timestamp, t01_return, t02_flow, t04_outdoor, t06_tank,
-                    t12_compressor, t33_comp_freq, t39_power_kw, d12_flow_rate, cop_calculated, heat_power_kw, mode)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT (timestamp) DO UPDATE SET
-                    t01_return = EXCLUDED.t01_return,
-                    t02_flow = EXCLUDED.t02_flow,
-                    t04_outdoor = EXCLUDED.t04_outdoor,
-                    t06_tank = EXCLUDED.t06_tank,
-                    t12_compressor = EXCLUDED.t12_compressor,
-                    t33_comp_freq = EXCLUDED.t33_comp_freq,
-                    t39_power_kw = EXCLUDED.t39_power_kw,
-                    d12_flow_rate = EXCLUDED.d12_flow_rate,
-                    cop_calculated = EXCLUDED.cop_calculated,
-                    heat_power_kw = EXCLUDED.heat_power_kw,
-                    mode = EXCLUDED.mode
-            ''', (
-                timestamp,
-                float(params.get('T01', 0) or 0),
-                float(params.get('T02', 0) or 0),
-                float(params.get('T04', 0) or 0),
-                float(params.get('T06', 0) or 0),
-                float(params.get('T12', 0) or 0),
-                float(params.get('T33', 0) or 0),
-                power_kw,  # Power kW (stored in t39_power_kw column)
-                t39,  # Flow m³/h (stored in d12_flow_rate column)
-                cop,
-                heat_power,
-                params.get('Mode', '')
-            ))
+            # Parse/plan the upsert once per pooled connection, then only send values
+            if conn not in _log_reading_prepared:
+                cur.execute('''
+                    PREPARE log_reading_ins AS
+                    INSERT INTO readings (timestamp, t01_return, t02_flow, t04_outdoor, t06_tank,
+                        t12_compressor, t33_comp_freq, t39_power_kw, d12_flow_rate, cop_calculated, heat_power_kw, mode)
+                    VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12)
+                    ON CONFLICT (timestamp) DO UPDATE SET
+                        t01_return = EXCLUDED.t01_return,
+                        t02_flow = EXCLUDED.t02_flow,
+                        t04_outdoor = EXCLUDED.t04_outdoor,
+                        t06_tank = EXCLUDED.t06_tank,
+                        t12_compressor = EXCLUDED.t12_compressor,
+                        t33_comp_freq = EXCLUDED.t33_comp_freq,
+                        t39_power_kw = EXCLUDED.t39_power_kw,
+                        d12_flow_rate = EXCLUDED.d12_flow_rate,
+                        cop_calculated = EXCLUDED.cop_calculated,
+                        heat_power_kw = EXCLUDED.heat_power_kw,
+                        mode = EXCLUDED.mode
+                ''')
+                _log_reading_prepared.add(conn)
+            cur.execute(
+                'EXECUTE log_reading_ins (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)',
+                values)
         else:
             cur.execute('''
                 INSERT OR REPLACE INTO readings (timestamp, t01_return, t02_flow, t04_outdoor, t06_tank,
                     t12_compressor, t33_comp_freq, t39_power_kw, d12_flow_rate, cop_calculated, heat_power_kw, mode)
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                timestamp.isoformat(),
-                float(params.get('T01', 0) or 0),
-                float(params.get('T02', 0) or 0),
-                float(params.get('T04', 0) or 0),
-                float(params.get('T06', 0) or 0),
-                float(params.get('T12', 0) or 0),
-                float(params.get('T33', 0) or 0),
-                power_kw,  # Power kW (stored in t39_power_kw column)
-                t39,  # Flow m³/h (stored in d12_flow_rate column)
-                cop,
-                heat_power,
-                params.get('Mode', '')
-            ))
+            ''', values)
 
         conn.commit()
-        conn.close()
+        _cached_local_history.cache_clear()
+        _cached_history_series.cache_clear()
+        _cached_wood_heating.cache_clear()
         return True
     except Exception as e:
         print(f"Error logging reading: {e}", flush=True)
         return False
+    finally:
+        release_db_connection(conn)
 
 def get_latest_readings():
     """Get latest values for all parameters from readings_raw"""
+    conn = None
     try:
         conn = get_db_connection()
         cur = conn.cursor()
@@ -580,7 +692,6 @@ def get_latest_readings():
             ''')
 
         rows = cur.fetchall()
-        conn.close()
 
         # Convert to dict with parameter names as keys
         result = {}
@@ -591,9 +702,12 @@ def get_latest_readings():
     except Exception as e:
         print(f"Error getting latest readings: {e}", flush=True)
         return {}
+    finally:
+        release_db_connection(conn)
 
 def get_history_from_db(parameters, hours=168):
     """Get historical data from readings_raw for specified parameters"""
+    conn = None
     try:
         conn = get_db_connection()
         cur = conn.cursor()
@@ -619,7 +733,6 @@ def get_history_from_db(parameters, hours=168):
             ''', (*parameters, cutoff))
 
         rows = cur.fetchall()
-        conn.close()
 
         # Organize by timestamp
         by_time = {}
@@ -640,13 +753,53 @@ def get_history_from_db(parameters, hours=168):
     except Exception as e:
         print(f"Error getting history from DB: {e}", flush=True)
         return []
+    finally:
+        release_db_connection(conn)
+
+def get_tank_outdoor_history(hours=168):
+    """(timestamp, T08, T04) rows from readings_raw, pivoted by the database; raises on errors"""
+    conn = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        if USE_POSTGRES:
+            cur.execute('''
+                SELECT timestamp,
+                       MAX(CASE WHEN parameter = 'T08' THEN value END),
+                       MAX(CASE WHEN parameter = 'T04' THEN value END)
+                FROM readings_raw
+                WHERE parameter IN ('T08', 'T04')
+                AND timestamp > NOW() - INTERVAL '%s hours'
+                GROUP BY timestamp
+                ORDER BY timestamp ASC
+            ''', (hours,))
+        else:
+            cutoff = (datetime.now() - timedelta(hours=hours)).isoformat()
+            cur.execute('''
+                SELECT timestamp,
+                       MAX(CASE WHEN parameter = 'T08' THEN value END),
+                       MAX(CASE WHEN parameter = 'T04' THEN value END)
+                FROM readings_raw
+                WHERE parameter IN ('T08', 'T04')
+                AND timestamp > ?
+                GROUP BY timestamp
+                ORDER BY timestamp ASC
+            ''', (cutoff,))
+
+        return cur.fetchall()
+    except Exception as e:
+        print(f"Error getting tank history: {e}", flush=True)
+        raise
+    finally:
+        release_db_connection(conn)
 
 def detect_wood_heating(hours=168, threshold_temp=5, threshold_minutes=20, target_override=None):
     """
     Detect wood heating sessions from database.
     Wood heating = Tank temp (T08) > Dynamic target (based on outdoor temp) + threshold_temp
     Dynamic target = compensate_offset - (compensate_slope × outdoor_temp)
-    Returns: dict with total_hours and sessions
+    Returns: dict with total_hours and sessions; raises on database errors
     """
     try:
         # Get AT curve parameters for dynamic target calculation
@@ -655,19 +808,33 @@ def detect_wood_heating(hours=168, threshold_temp=5, threshold_minutes=20, targe
         slope = float(latest.get('compensate_slope') or 1.0)
 
         # Get T08 (tank) and T04 (outdoor) readings from database
-        readings = get_history_from_db(['T08', 'T04'], hours)
+        readings = get_tank_outdoor_history(hours)
 
         if not readings:
             return {'total_hours': 0, 'sessions': 0, 'periods': [], 'offset': offset, 'slope': slope}
 
-        sessions = []
+        # Sessions are measured, totalled and formatted once, as they end
+        periods = []
+        total_minutes = 0
+
+        def close_session(session):
+            nonlocal total_minutes
+            minutes = (session['end'] - session['start']).total_seconds() / 60
+            if minutes < threshold_minutes:
+                return
+            total_minutes += minutes
+            periods.append({
+                'start': session['start'].isoformat(),
+                'end': session['end'].isoformat(),
+                'hours': round(minutes / 60, 1),
+                'max_temp': round(session['max_temp'], 1),
+                'target': session['target_at_start']
+            })
+
         current_session = None
         last_outdoor = 0  # Fallback outdoor temp
 
-        for reading in readings:
-            tank_temp = reading.get('T08')
-            outdoor_temp = reading.get('T04')
-
+        for timestamp, tank_temp, outdoor_temp in readings:
             if outdoor_temp is not None:
                 last_outdoor = outdoor_temp
             else:
@@ -676,7 +843,6 @@ def detect_wood_heating(hours=168, threshold_temp=5, threshold_minutes=20, targe
             if tank_temp is None:
                 continue
 
-            timestamp = reading['timestamp']
             if isinstance(timestamp, str):
                 ts = datetime.fromisoformat(timestamp.replace('Z', '+00:00').replace('+00:00', ''))
             else:
@@ -705,42 +871,17 @@ def detect_wood_heating(hours=168, threshold_temp=5, threshold_minutes=20, targe
                 else:
                     current_session['end'] = ts
                     current_session['max_temp'] = max(current_session['max_temp'], tank_temp)
-            else:
-                if current_session is not None:
-                    # Check if session was long enough
-                    duration = (current_session['end'] - current_session['start']).total_seconds() / 60
-                    if duration >= threshold_minutes:
-                        sessions.append(current_session)
-                    current_session = None
+            elif current_session is not None:
+                close_session(current_session)
+                current_session = None
 
         # Handle ongoing session
         if current_session is not None:
-            duration = (current_session['end'] - current_session['start']).total_seconds() / 60
-            if duration >= threshold_minutes:
-                sessions.append(current_session)
-
-        # Calculate total hours
-        total_minutes = sum(
-            (s['end'] - s['start']).total_seconds() / 60
-            for s in sessions
-        )
-        total_hours = total_minutes / 60
-
-        # Format periods for display
-        periods = [
-            {
-                'start': s['start'].isoformat(),
-                'end': s['end'].isoformat(),
-                'hours': round((s['end'] - s['start']).total_seconds() / 3600, 1),
-                'max_temp': round(s.get('max_temp', 0), 1),
-                'target': s.get('target_at_start', 0)
-            }
-            for s in sessions
-        ]
+            close_session(current_session)
 
         return {
-            'total_hours': round(total_hours, 1),
-            'sessions': len(sessions),
+            'total_hours': round(total_minutes / 60, 1),
+            'sessions': len(periods),
             'periods': periods,
             'offset': offset,
             'slope': slope,
@@ -748,18 +889,25 @@ def detect_wood_heating(hours=168, threshold_temp=5, threshold_minutes=20, targe
         }
     except Exception as e:
         print(f"Error detecting wood heating: {e}", flush=True)
-        return {'total_hours': 0, 'sessions': 0, 'periods': []}
+        raise
+
+@lru_cache(maxsize=8)
+def _cached_wood_heating(hours, target, threshold, bucket):
+    """detect_wood_heating() memoized per minute bucket, cleared by log_reading() and
+    import_cloud_history(); errors are not cached"""
+    return detect_wood_heating(hours=hours, target_override=target, threshold_temp=threshold)
 
 def import_cloud_history(hours=72):
     """
     Import historical data from cloud API to populate readings_raw table.
     Cloud API supports up to 72 hours of history.
     """
+    conn = None
     try:
         print(f"Importing {hours}h history from cloud API...", flush=True)
 
-        client = PerifalClient(USERNAME, PASSWORD)
-        if not client.login():
+        client = get_shared_client()
+        if client is None:
             print("Failed to login to cloud API", flush=True)
             return 0
 
@@ -777,14 +925,20 @@ def import_cloud_history(hours=72):
             '2050': 'T12',      # Compressor temp (if available)
         }
 
-        conn = get_db_connection()
-        cur = conn.cursor()
+        # The series are independent, so fetch them concurrently
+        with ThreadPoolExecutor(max_workers=len(history_params)) as executor:
+            futures = {
+                address: executor.submit(client.get_history, DEVICE_CODE, address, start_time, end_time, "day")
+                for address in history_params
+            }
 
-        total_imported = 0
+        # Collect all points first and write them in one batch;
+        # keyed on (timestamp, parameter) so a batch never upserts a row twice
+        rows = {}
 
         for address, param_name in history_params.items():
             try:
-                data = client.get_history(DEVICE_CODE, address, start_time, end_time, "day")
+                data = futures[address].result()
 
                 if not isinstance(data, dict):
                     continue
@@ -798,25 +952,12 @@ def import_cloud_history(hours=72):
                         dt_str = point.get('dateTime')  # Format: "YYYY-MM-DD HH"
                         value = float(point.get('addressValue', 0))
 
-                        # Parse datetime
-                        timestamp = datetime.strptime(dt_str, '%Y-%m-%d %H')
-
-                        # Round to nearest 10 minutes (for consistency with live logging)
-                        timestamp = timestamp.replace(minute=0, second=0, microsecond=0)
+                        # Parse datetime (whole hours, like the live logger's readings)
+                        timestamp = parse_cloud_hour(dt_str)
 
-                        if USE_POSTGRES:
-                            cur.execute('''
-                                INSERT INTO readings_raw (timestamp, parameter, value)
-                                VALUES (%s, %s, %s)
-                                ON CONFLICT (timestamp, parameter) DO UPDATE SET value = EXCLUDED.value
-                            ''', (timestamp, param_name, value))
-                        else:
-                            cur.execute('''
-                                INSERT OR REPLACE INTO readings_raw (timestamp, parameter, value)
-                                VALUES (?, ?, ?)
-                            ''', (timestamp.isoformat(), param_name, value))
-
-                        total_imported += 1
+                        if not USE_POSTGRES:
+                            timestamp = timestamp.isoformat()
+                        rows[(timestamp, param_name)] = (timestamp, param_name, value)
 
                     except (ValueError, TypeError) as e:
                         continue
@@ -826,8 +967,38 @@ def import_cloud_history(hours=72):
             except Exception as e:
                 print(f"  {param_name}: Error - {e}", flush=True)
 
+        total_imported = len(rows)
+
+        conn = get_db_connection()
+        cur = conn.cursor()
+
+        if USE_POSTGRES:
+            # COPY is PostgreSQL's bulk-load fast path but cannot upsert, so load
+            # into a temp table and upsert from it in a single statement
+            buf = io.StringIO()
+            for timestamp, param_name, value in rows.values():
+                buf.write(f"{timestamp.isoformat()}\t{param_name}\t{value!r}\n")
+            buf.seek(0)
+            cur.execute('''
+                CREATE TEMP TABLE readings_raw_import (
+                    timestamp TIMESTAMP, parameter VARCHAR(50), value REAL
+                ) ON COMMIT DROP
+            ''')
+            cur.copy_expert('COPY readings_raw_import (timestamp, parameter, value) FROM STDIN', buf)
+            cur.execute('''
+                INSERT INTO readings_raw (timestamp, parameter, value)
+                SELECT timestamp, parameter, value FROM readings_raw_import
+                ON CONFLICT (timestamp, parameter) DO UPDATE SET value = EXCLUDED.value
+            ''')
+        else:
+            cur.executemany('''
+                INSERT OR REPLACE INTO readings_raw (timestamp, parameter, value)
+                VALUES (?, ?, ?)
+            ''', list(rows.values()))
+
         conn.commit()
-        conn.close()
+        # Wood-heating stats are computed from readings_raw
+        _cached_wood_heating.cache_clear()
 
         print(f"Imported {total_imported} data points from cloud", flush=True)
         return total_imported
@@ -835,64 +1006,236 @@ def import_cloud_history(hours=72):
     except Exception as e:
         print(f"Error importing cloud history: {e}", flush=True)
         return 0
+    finally:
+        release_db_connection(conn)
+
+@dataclass
+class HistoryReading:
+    """One row of get_local_history(); orjson serializes it as an object"""
+    __slots__ = ('timestamp', 't01_return', 't02_flow', 't04_outdoor', 't06',
+                 't39_power_kw', 'cop_calculated')
+    timestamp: object  # datetime (PostgreSQL) or ISO string (SQLite)
+    t01_return: float
+    t02_flow: float
+    t04_outdoor: float
+    t06: float
+    t39_power_kw: float
+    cop_calculated: float
+
+def _select_local_history(cur, hours):
+    """Run the readings query for get_local_history(); columns match HistoryReading"""
+    if USE_POSTGRES:
+        cur.execute('''
+            SELECT timestamp, t01_return, t02_flow, t04_outdoor, t06_tank,
+                   t39_power_kw, cop_calculated
+            FROM readings
+            WHERE timestamp > NOW() - INTERVAL '%s hours'
+            ORDER BY timestamp ASC
+        ''', (hours,))
+    else:
+        cutoff = (datetime.now() - timedelta(hours=hours)).isoformat()
+        cur.execute('''
+            SELECT timestamp, t01_return, t02_flow, t04_outdoor, t06_tank,
+                   t39_power_kw, cop_calculated
+            FROM readings
+            WHERE timestamp > ?
+            ORDER BY timestamp ASC
+        ''', (cutoff,))
+
+def fetch_local_history(hours=72):
+    """Get history from local database; raises on database errors"""
+    conn = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        _select_local_history(cur, hours)
+        rows = cur.fetchall()
+
+        # Column order matches HistoryReading's fields
+        return [HistoryReading(*row) for row in rows]
+    finally:
+        release_db_connection(conn)
 
 def get_local_history(hours=72):
-    """Get history from local database"""
+    """Get history from local database; empty on errors"""
+    try:
+        return fetch_local_history(hours)
+    except Exception as e:
+        print(f"Error getting local history: {e}", flush=True)
+        return []
+
+def iter_local_history_ndjson(hours=72):
+    """
+    Yield local history as NDJSON, one reading per line, a batch of rows at a time.
+    Yields nothing if there are no rows or the query fails. A failure after rows
+    have gone out ends the body with an {"error": ...} line, so a cut-off stream
+    can be told from a complete one.
+    """
+    conn = None
+    sent = False
+    try:
+        conn = get_db_connection()
+        # A named (server-side) cursor makes PostgreSQL send the rows in batches too
+        cur = conn.cursor(name='local_history_stream') if USE_POSTGRES else conn.cursor()
+        _select_local_history(cur, hours)
+        while True:
+            rows = cur.fetchmany(1000)
+            if not rows:
+                break
+            yield b''.join(orjson.dumps(HistoryReading(*row)) + b'\n' for row in rows)
+            sent = True
+    except Exception as e:
+        print(f"Error streaming local history: {e}", flush=True)
+        if sent:
+            yield orjson.dumps({'error': str(e)}) + b'\n'
+    finally:
+        release_db_connection(conn)
+
+def get_local_history_json(hours=72):
+    """
+    Get history from local database, serialized to a JSON array by the database.
+    Returns (count, json_text) so the API can respond without building row dicts.
+    Raises on database errors.
+    """
+    conn = None
     try:
         conn = get_db_connection()
         cur = conn.cursor()
 
         if USE_POSTGRES:
             cur.execute('''
-                SELECT timestamp, t01_return, t02_flow, t04_outdoor, t06_tank,
-                       t39_power_kw, cop_calculated
+                SELECT COUNT(*), COALESCE(json_agg(json_build_object(
+                    'timestamp', timestamp, 't01_return', t01_return, 't02_flow', t02_flow,
+                    't04_outdoor', t04_outdoor, 't06', t06_tank,
+                    't39_power_kw', t39_power_kw, 'cop_calculated', cop_calculated
+                ) ORDER BY timestamp)::text, '[]')
                 FROM readings
                 WHERE timestamp > NOW() - INTERVAL '%s hours'
-                ORDER BY timestamp ASC
             ''', (hours,))
         else:
             cutoff = (datetime.now() - timedelta(hours=hours)).isoformat()
             cur.execute('''
-                SELECT timestamp, t01_return, t02_flow, t04_outdoor, t06_tank,
-                       t39_power_kw, cop_calculated
-                FROM readings
-                WHERE timestamp > ?
-                ORDER BY timestamp ASC
+                SELECT COUNT(*), json_group_array(json_object(
+                    'timestamp', timestamp, 't01_return', t01_return, 't02_flow', t02_flow,
+                    't04_outdoor', t04_outdoor, 't06', t06_tank,
+                    't39_power_kw', t39_power_kw, 'cop_calculated', cop_calculated
+                ))
+                FROM (
+                    SELECT timestamp, t01_return, t02_flow, t04_outdoor, t06_tank,
+                           t39_power_kw, cop_calculated
+                    FROM readings
+                    WHERE timestamp > ?
+                    ORDER BY timestamp ASC
+                )
             ''', (cutoff,))
 
-        rows = cur.fetchall()
-        conn.close()
-
-        readings = []
-        for row in rows:
-            if USE_POSTGRES:
-                readings.append({
-                    'timestamp': row[0].isoformat() if row[0] else None,
-                    't01_return': row[1],
-                    't02_flow': row[2],
-                    't04_outdoor': row[3],
-                    't06': row[4],
-                    't39_power_kw': row[5],
-                    'cop_calculated': row[6]
-                })
-            else:
-                readings.append({
-                    'timestamp': row['timestamp'],
-                    't01_return': row['t01_return'],
-                    't02_flow': row['t02_flow'],
-                    't04_outdoor': row['t04_outdoor'],
-                    't06': row['t06_tank'],
-                    't39_power_kw': row['t39_power_kw'],
-                    'cop_calculated': row['cop_calculated']
-                })
-
-        return readings
+        row = cur.fetchone()
+        return row[0], row[1]
     except Exception as e:
         print(f"Error getting local history: {e}", flush=True)
-        return []
+        raise
+    finally:
+        release_db_connection(conn)
+
+@lru_cache(maxsize=8)
+def _cached_local_history(hours, bucket):
+    """get_local_history_json() memoized per minute bucket, cleared by log_reading(); errors are not cached"""
+    return get_local_history_json(hours)
+
+# Series drawn by the history chart; COP above MAX_CHART_COP is measurement noise
+HISTORY_SERIES = ('t02_flow', 't04_outdoor', 't06', 'cop_calculated', 't39_power_kw')
+MAX_CHART_COP = 5.0
+MAX_HISTORY_POINTS = 10000
+
+def lttb(xs, ys, threshold):
+    """
+    Largest-Triangle-Three-Buckets downsampling (Steinarsson, 2013).
+    Returns the indices of the `threshold` points that best keep the line's shape.
+    """
+    n = len(xs)
+    if threshold >= n or threshold < 3:
+        return range(n)
+
+    every = (n - 2) / (threshold - 2)
+    selected = [0]
+    a = 0
+    for i in range(threshold - 2):
+        # Average of the next bucket is the third corner of the triangle
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        avg_x = sum(xs[next_start:next_end]) / (next_end - next_start)
+        avg_y = sum(ys[next_start:next_end]) / (next_end - next_start)
+
+        ax, ay = xs[a], ys[a]
+        best, best_area = next_start - 1, -1.0
+        for j in range(int(i * every) + 1, next_start):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        selected.append(best)
+        a = best
+    selected.append(n - 1)
+    return selected
+
+def downsample_history(readings, max_points):
+    """
+    Split readings (dicts or HistoryReading) into chart series of {x, y} points,
+    each reduced with LTTB to at most max_points. Nulls are dropped.
+    """
+    if not readings:
+        return {key: [] for key in HISTORY_SERIES}
+
+    get = dict.get if isinstance(readings[0], dict) else getattr
+    columns = {key: ([], [], []) for key in HISTORY_SERIES}  # (labels, epochs, values)
+
+    # One pass over the rows: each timestamp is parsed once for all series
+    for r in readings:
+        ts = get(r, 'timestamp')
+        if isinstance(ts, datetime):
+            label, epoch = ts.isoformat(), ts.timestamp()
+        else:
+            label, epoch = ts, datetime.fromisoformat(ts).timestamp()
+        for key, (labels, xs, ys) in columns.items():
+            y = get(r, key)
+            if y is None or (key == 'cop_calculated' and y > MAX_CHART_COP):
+                continue
+            labels.append(label)
+            xs.append(epoch)
+            ys.append(y)
+
+    return {
+        key: [{'x': labels[j], 'y': ys[j]} for j in lttb(xs, ys, max_points)]
+        for key, (labels, xs, ys) in columns.items()
+    }
+
+# Packed history: header '<4sII' (magic, row count N, column count), then
+# N int32 epoch seconds, then N float32 per HISTORY_BIN_COLUMNS column, NaN for null
+HISTORY_BIN_MAGIC = b'LVH1'
+HISTORY_BIN_COLUMNS = HistoryReading.__slots__[1:]
+
+def pack_history(readings):
+    """Columnar little-endian binary form of HistoryReading rows (see HISTORY_BIN_MAGIC)"""
+    nan = float('nan')
+    stamps = array('i', (
+        int((ts if isinstance(ts, datetime) else datetime.fromisoformat(ts)).timestamp())
+        for ts in (r.timestamp for r in readings)))
+    columns = [array('f', (nan if v is None else v for v in (getattr(r, key) for r in readings)))
+               for key in HISTORY_BIN_COLUMNS]
+    if sys.byteorder == 'big':
+        for a in (stamps, *columns):
+            a.byteswap()
+    header = struct.pack('<4sII', HISTORY_BIN_MAGIC, len(readings), len(columns))
+    return b''.join([header, stamps.tobytes(), *(c.tobytes() for c in columns)])
+
+@lru_cache(maxsize=8)
+def _cached_history_series(hours, max_points, bucket):
+    """Downsampled local history memoized per minute bucket, cleared by log_reading(); errors are not cached"""
+    readings = fetch_local_history(hours)
+    return len(readings), downsample_history(readings, max_points)
 
 def get_db_stats():
     """Get database statistics"""
+    conn = None
     try:
         conn = get_db_connection()
         cur = conn.cursor()
@@ -903,7 +1246,6 @@ def get_db_stats():
             cur.execute('SELECT COUNT(*), MIN(timestamp), MAX(timestamp) FROM readings')
 
         row = cur.fetchone()
-        conn.close()
 
         return {
             'count': row[0] if row else 0,
@@ -913,32 +1255,46 @@ def get_db_stats():
     except Exception as e:
         print(f"Error getting db stats: {e}", flush=True)
         return {'count': 0, 'oldest': None, 'newest': None}
+    finally:
+        release_db_connection(conn)
 
 # Background logging thread
 logging_active = False
+_logger_stop = threading.Event()
 
 def background_logger():
     """Background thread that logs data every 10 minutes"""
     global logging_active
     print("Background logger started", flush=True)
 
+    # Count rows once; readings are hourly upserts, so only a new hour adds a row
+    stats = get_db_stats()
+    row_count = stats['count']
+    newest = stats['newest']
+    last_hour = datetime.fromisoformat(newest) if isinstance(newest, str) else newest
+
     while logging_active:
         try:
-            client = PerifalClient(USERNAME, PASSWORD)
-            if client.login():
+            client = get_shared_client()
+            if client:
+                # get_all_parameters() re-logs in on an expired token by itself
                 params = client.get_all_parameters(DEVICE_CODE, ALL_PARAMS)
                 if params:
                     if log_reading(params):
-                        stats = get_db_stats()
-                        print(f"Logged reading at {datetime.now().strftime('%H:%M')} - DB has {stats['count']} readings", flush=True)
+                        hour = datetime.now().replace(minute=0, second=0, microsecond=0)
+                        if hour != last_hour:
+                            row_count += 1
+                            last_hour = hour
+                        print(f"Logged reading at {datetime.now().strftime('%H:%M')} - DB has {row_count} readings", flush=True)
+                else:
+                    # Start over with a fresh client and login next tick
+                    reset_shared_client()
         except Exception as e:
             print(f"Logger error: {e}", flush=True)
 
-        # Sleep 10 minutes (check every 10 sec if we should stop)
-        for _ in range(60):
-            if not logging_active:
-                break
-            time.sleep(10)
+        # Sleep 10 minutes, waking immediately if stop_logger() is called
+        if _logger_stop.wait(timeout=600):
+            break
 
     print("Background logger stopped", flush=True)
 
@@ -947,6 +1303,7 @@ def start_logger():
     global logging_active
     if not logging_active:
         logging_active = True
+        _logger_stop.clear()
         thread = threading.Thread(target=background_logger, daemon=True)
         thread.start()
 
@@ -954,9 +1311,158 @@ def stop_logger():
     """Stop the background logger"""
     global logging_active
     logging_active = False
+    _logger_stop.set()
 
 # ============== End Database Functions ==============
 
+# ============== Live Status Stream ==============
+
+STATUS_POLL_SECONDS = 10
+STREAM_MAX_SECONDS = 300  # Browsers reconnect by themselves; frees the worker thread
+# Each open stream holds one of the Procfile's 8 gunicorn threads for up to
+# STREAM_MAX_SECONDS, so keep half free; refused clients poll /api/status
+STREAM_MAX_SUBSCRIBERS = 4
+
+# One poller feeds every open stream, so N tabs cost one cloud request per tick
+_status_cond = threading.Condition()
+_status_params = {}
+_status_keys = []
+_status_version = 0
+_status_subscribers = 0
+_status_poller_running = False
+
+def status_poller():
+    """Poll the cloud while anyone is subscribed and publish changed snapshots"""
+    global _status_params, _status_keys, _status_version, _status_poller_running
+    while True:
+        with _status_cond:
+            if _status_subscribers == 0:
+                _status_poller_running = False
+                return
+        try:
+            client = get_shared_client()
+            params = client.get_all_parameters(DEVICE_CODE, ALL_PARAMS) if client else {}
+            if params:
+                with _status_cond:
+                    if params != _status_params:
+                        if params.keys() != _status_params.keys():
+                            # Sorted once here instead of in every browser
+                            _status_keys = sorted(params)
+                        _status_params = params
+                        _status_version += 1
+                        _status_cond.notify_all()
+            else:
+                reset_shared_client()
+        except Exception as e:
+            print(f"Status poller error: {e}", flush=True)
+        time.sleep(STATUS_POLL_SECONDS)
+
+# /api/status answers from one encoded payload for a couple of seconds,
+# so any number of open dashboards cost one cloud request per window
+STATUS_CACHE_SECONDS = 2
+_status_body = b'{}'
+_status_body_at = float('-inf')
+_status_body_lock = threading.Lock()
+
+def cached_status_body():
+    """Encoded live status, refetched at most every STATUS_CACHE_SECONDS"""
+    global _status_body, _status_body_at
+    # Held across the fetch: concurrent requests wait and share its result
+    with _status_body_lock:
+        if time.monotonic() - _status_body_at >= STATUS_CACHE_SECONDS:
+            client = get_shared_client()
+            _status_body = orjson.dumps(client.get_all_parameters(DEVICE_CODE, ALL_PARAMS) if client else {})
+            _status_body_at = time.monotonic()
+        return _status_body
+
+def invalidate_status_cache():
+    """Make the next /api/status refetch, e.g. after a control change"""
+    global _status_body_at
+    with _status_body_lock:
+        _status_body_at = float('-inf')
+
+def wood_summary():
+    """The 7-day wood-heating figures shown on the dashboard; None if they cannot be read"""
+    try:
+        result = _cached_wood_heating(168, None, 5, int(time.time() // 60))
+    except Exception:
+        return None
+    return {'total_hours': result['total_hours'], 'sessions': result['sessions']}
+
+def open_status_stream():
+    """Take a stream slot and make sure the poller runs; False when all slots are taken"""
+    global _status_subscribers, _status_poller_running
+    with _status_cond:
+        if _status_subscribers >= STREAM_MAX_SUBSCRIBERS:
+            return False
+        _status_subscribers += 1
+        if not _status_poller_running:
+            _status_poller_running = True
+            threading.Thread(target=status_poller, daemon=True).start()
+    return True
+
+def close_status_stream():
+    """Give back the slot taken by open_status_stream()"""
+    global _status_subscribers
+    with _status_cond:
+        _status_subscribers -= 1
+
+def status_events(with_wood=False):
+    """Server-sent events: the full snapshot first, then only changed keys.
+
+    Each event is {"changed": {...}} plus "keys" (every key, sorted) whenever
+    the key set differs from what this stream has sent before. With with_wood,
+    the same event also carries "wood" (see wood_summary()) when it changed,
+    so one message per tick covers everything the dashboard shows live.
+    The caller holds a slot from open_status_stream().
+    """
+    yield 'retry: 5000\n\n'
+    sent = {}
+    sent_wood = None
+    version = -1
+    deadline = time.monotonic() + STREAM_MAX_SECONDS
+    while time.monotonic() < deadline:
+        with _status_cond:
+            if _status_version == version:
+                _status_cond.wait(timeout=15)
+            params, keys, version = _status_params, _status_keys, _status_version
+        event = {}
+        changed = {k: v for k, v in params.items() if sent.get(k) != v}
+        if changed:
+            event['changed'] = changed
+            if params.keys() != sent.keys():
+                event['keys'] = keys
+            sent = params
+        if with_wood:
+            wood = wood_summary()
+            if wood is not None and wood != sent_wood:
+                event['wood'] = sent_wood = wood
+        if event:
+            yield f"data: {orjson.dumps(event).decode()}\n\n"
+        else:
+            yield ': keepalive\n\n'
+
+# ============== Page Minification ==============
+
+_INLINE_CODE_RE = re.compile(r'(<(script|style)\b[^>]*>)(.*?)(</\2>)', re.S)
+
+def minify_html(html):
+    """Minify inline scripts and styles and drop indentation; run once at import"""
+    out = []
+    pos = 0
+    for m in _INLINE_CODE_RE.finditer(html):
+        out.append(_strip_lines(html[pos:m.start()]))
+        code = m.group(3)
+        code = rjsmin.jsmin(code) if m.group(2) == 'script' else rcssmin.cssmin(code)
+        out.append(m.group(1) + code + m.group(4))
+        pos = m.end()
+    out.append(_strip_lines(html[pos:]))
+    return ''.join(out)
+
+def _strip_lines(markup):
+    # Newlines stay so adjacent inline elements keep their separating space
+    return '\n'.join(line.strip() for line in markup.splitlines() if line.strip())
+
 # ============== Auth Templates ==============
 
 LOGIN_TEMPLATE = """
@@ -1103,16 +1609,17 @@ MESSAGE_TEMPLATE = """
 </html>
 """
 
+# Compiled once; render_template_string() re-parses the source on every call
+app.config['TEMPLATES_AUTO_RELOAD'] = False
+app.jinja_env.auto_reload = False
+LOGIN_TMPL = app.jinja_env.from_string(minify_html(LOGIN_TEMPLATE))
+REGISTER_TMPL = app.jinja_env.from_string(minify_html(REGISTER_TEMPLATE))
+MESSAGE_TMPL = app.jinja_env.from_string(minify_html(MESSAGE_TEMPLATE))
+
 # ============== End Auth Templates ==============
 
-SETTINGS_TEMPLATE = """
-<!DOCTYPE html>
-<html lang="sv">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Inställningar - Perifal LV-418</title>
-    <style>
+# Rules shared by the settings page and the dashboard
+BASE_STYLE = """
         * { box-sizing: border-box; margin: 0; padding: 0; }
         body {
             font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
@@ -1121,7 +1628,6 @@ SETTINGS_TEMPLATE = """
             min-height: 100vh;
             padding: 15px;
         }
-        .container { max-width: 1200px; margin: 0 auto; }
         header {
             display: flex;
             justify-content: space-between;
@@ -1144,14 +1650,68 @@ SETTINGS_TEMPLATE = """
             padding: 15px;
             backdrop-filter: blur(10px);
             border: 1px solid rgba(255,255,255,0.1);
-            margin-bottom: 15px;
-        }
-        .card h2 {
-            font-size: 1em;
-            margin-bottom: 12px;
-            color: #90caf9;
         }
-        .controls {
+        .message.error { background: #ff5252; }
+"""
+
+# Script shared by the settings page and the dashboard: messages and pump control
+COMMON_SCRIPT = """
+        function showMessage(text, isError = false) {
+            const msg = document.getElementById('message');
+            msg.textContent = text;
+            msg.className = 'message show' + (isError ? ' error' : '');
+            setTimeout(() => msg.className = 'message', 3000);
+        }
+
+        // Pump control needs a server-side unlock, valid for 5 minutes per session
+        function postControl(code, value) {
+            // Form-encoded: fetch sets the Content-Type itself
+            return fetch('/api/control', {
+                method: 'POST',
+                body: new URLSearchParams({code, value: String(value)})
+            });
+        }
+
+        async function unlockControl() {
+            const pwd = prompt('⚠️ VARNING: Du är på väg att ändra pumpen.\\n\\nAnge lösenord för att bekräfta:');
+            if (pwd === null) return false;
+            const res = await fetch('/api/unlock', {
+                method: 'POST',
+                body: new URLSearchParams({password: pwd})
+            });
+            if (!res.ok) showMessage('Fel lösenord!', true);
+            return res.ok;
+        }
+
+        async function setParam(code, value) {
+            try {
+                let res = await postControl(code, value);
+                if (res.status === 401) {
+                    if (!await unlockControl()) return;
+                    res = await postControl(code, value);
+                }
+                const data = await res.json();
+                if (data.success) {
+                    showMessage('Sparat: ' + code + ' = ' + value);
+                    fetchStatus();
+                } else {
+                    showMessage('Fel', true);
+                }
+            } catch (e) {
+                showMessage('Anslutningsfel', true);
+            }
+        }
+"""
+
+SETTINGS_STYLE = """
+        .container { max-width: 1200px; margin: 0 auto; }
+        .card { margin-bottom: 15px; }
+        .card h2 {
+            font-size: 1em;
+            margin-bottom: 12px;
+            color: #90caf9;
+        }
+        .controls {
             display: grid;
             grid-template-columns: repeat(auto-fit, minmax(200px, 1fr));
             gap: 12px;
@@ -1212,7 +1772,6 @@ SETTINGS_TEMPLATE = """
             transition: opacity 0.3s;
         }
         .message.show { opacity: 1; }
-        .message.error { background: #ff5252; }
         .debug-table {
             width: 100%;
             border-collapse: collapse;
@@ -1248,7 +1807,17 @@ SETTINGS_TEMPLATE = """
             color: #888;
             margin-top: 10px;
         }
-    </style>
+"""
+
+SETTINGS_TEMPLATE = """
+<!DOCTYPE html>
+<html lang="sv">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Inställningar - Perifal LV-418</title>
+    <link rel="stylesheet" href="/assets/base.css">
+    <link rel="stylesheet" href="/assets/settings.css">
 </head>
 <body>
     <div class="container">
@@ -1270,26 +1839,26 @@ SETTINGS_TEMPLATE = """
                     <label>Kurva offset</label>
                     <div class="control-row">
                         <input type="number" id="inputCurveOffset" step="0.5" min="15" max="60">
-                        <button onclick="safeSetParam('compensate_offset', document.getElementById('inputCurveOffset').value)">OK</button>
+                        <button data-code="compensate_offset" data-input="inputCurveOffset">OK</button>
                     </div>
                 </div>
                 <div class="control-item">
                     <label>Kurva lutning</label>
                     <div class="control-row">
                         <input type="number" id="inputCurveSlope" step="0.1" min="0" max="3.5">
-                        <button onclick="safeSetParam('compensate_slope', document.getElementById('inputCurveSlope').value)">OK</button>
+                        <button data-code="compensate_slope" data-input="inputCurveSlope">OK</button>
                     </div>
                 </div>
                 <div class="control-item">
                     <label>VV börvärde</label>
                     <div class="control-row">
                         <input type="number" id="inputHwTarget" step="1" min="30" max="58">
-                        <button onclick="safeSetParam('R01', document.getElementById('inputHwTarget').value)">OK</button>
+                        <button data-code="R01" data-input="inputHwTarget">OK</button>
                     </div>
                 </div>
                 <div class="control-item">
                     <label>Tyst läge</label>
-                    <button id="silentBtn" class="toggle inactive" onclick="safeToggleSilent()">AV</button>
+                    <button id="silentBtn" class="toggle inactive" onclick="toggleSilent()">AV</button>
                 </div>
             </div>
 
@@ -1299,19 +1868,19 @@ SETTINGS_TEMPLATE = """
                     <label>Värme börvärde (M1)</label>
                     <div class="control-row">
                         <input type="number" id="inputM1HeatTarget" step="1" min="15" max="60">
-                        <button onclick="safeSetParam('M1 Heating Target', document.getElementById('inputM1HeatTarget').value)">OK</button>
+                        <button data-code="M1 Heating Target" data-input="inputM1HeatTarget">OK</button>
                     </div>
                 </div>
                 <div class="control-item">
                     <label>Max effekt %</label>
                     <div class="control-row">
                         <input type="number" id="inputMaxPower" step="5" min="0" max="100">
-                        <button onclick="safeSetParam('M1 Max. Power', document.getElementById('inputMaxPower').value)">OK</button>
+                        <button data-code="M1 Max. Power" data-input="inputMaxPower">OK</button>
                     </div>
                 </div>
                 <div class="control-item">
                     <label>Pump PÅ/AV</label>
-                    <button id="powerBtn" class="toggle active" onclick="safeTogglePower()">PÅ</button>
+                    <button id="powerBtn" class="toggle active" onclick="togglePower()">PÅ</button>
                 </div>
                 <div class="control-item">
                     <label>SG Ready läge</label>
@@ -1322,7 +1891,7 @@ SETTINGS_TEMPLATE = """
                             <option value="2">Lågt elpris</option>
                             <option value="3">Överskott</option>
                         </select>
-                        <button onclick="safeSetParam('SG Status', document.getElementById('inputSG').value)">OK</button>
+                        <button data-code="SG Status" data-input="inputSG">OK</button>
                     </div>
                 </div>
             </div>
@@ -1333,49 +1902,49 @@ SETTINGS_TEMPLATE = """
                     <label>CP1-1 (-20°C)</label>
                     <div class="control-row">
                         <input type="number" id="inputCP1_1" step="1">
-                        <button onclick="safeSetParam('CP1-1', document.getElementById('inputCP1_1').value)">OK</button>
+                        <button data-code="CP1-1" data-input="inputCP1_1">OK</button>
                     </div>
                 </div>
                 <div class="control-item">
                     <label>CP1-2 (-10°C)</label>
                     <div class="control-row">
                         <input type="number" id="inputCP1_2" step="1">
-                        <button onclick="safeSetParam('CP1-2', document.getElementById('inputCP1_2').value)">OK</button>
+                        <button data-code="CP1-2" data-input="inputCP1_2">OK</button>
                     </div>
                 </div>
                 <div class="control-item">
                     <label>CP1-3 (0°C)</label>
                     <div class="control-row">
                         <input type="number" id="inputCP1_3" step="1">
-                        <button onclick="safeSetParam('CP1-3', document.getElementById('inputCP1_3').value)">OK</button>
+                        <button data-code="CP1-3" data-input="inputCP1_3">OK</button>
                     </div>
                 </div>
                 <div class="control-item">
                     <label>CP1-4 (5°C)</label>
                     <div class="control-row">
                         <input type="number" id="inputCP1_4" step="1">
-                        <button onclick="safeSetParam('CP1-4', document.getElementById('inputCP1_4').value)">OK</button>
+                        <button data-code="CP1-4" data-input="inputCP1_4">OK</button>
                     </div>
                 </div>
                 <div class="control-item">
                     <label>CP1-5 (10°C)</label>
                     <div class="control-row">
                         <input type="number" id="inputCP1_5" step="1">
-                        <button onclick="safeSetParam('CP1-5', document.getElementById('inputCP1_5').value)">OK</button>
+                        <button data-code="CP1-5" data-input="inputCP1_5">OK</button>
                     </div>
                 </div>
                 <div class="control-item">
                     <label>CP1-6 (15°C)</label>
                     <div class="control-row">
                         <input type="number" id="inputCP1_6" step="1">
-                        <button onclick="safeSetParam('CP1-6', document.getElementById('inputCP1_6').value)">OK</button>
+                        <button data-code="CP1-6" data-input="inputCP1_6">OK</button>
                     </div>
                 </div>
                 <div class="control-item">
                     <label>CP1-7 (20°C)</label>
                     <div class="control-row">
                         <input type="number" id="inputCP1_7" step="1">
-                        <button onclick="safeSetParam('CP1-7', document.getElementById('inputCP1_7').value)">OK</button>
+                        <button data-code="CP1-7" data-input="inputCP1_7">OK</button>
                     </div>
                 </div>
             </div>
@@ -1386,14 +1955,14 @@ SETTINGS_TEMPLATE = """
                     <label>Zone 2 Offset</label>
                     <div class="control-row">
                         <input type="number" id="inputZ2Offset" step="0.5">
-                        <button onclick="safeSetParam('Zone 2 Curve Offset', document.getElementById('inputZ2Offset').value)">OK</button>
+                        <button data-code="Zone 2 Curve Offset" data-input="inputZ2Offset">OK</button>
                     </div>
                 </div>
                 <div class="control-item">
                     <label>Zone 2 Slope</label>
                     <div class="control-row">
                         <input type="number" id="inputZ2Slope" step="0.1">
-                        <button onclick="safeSetParam('Zone 2 Cure Slope', document.getElementById('inputZ2Slope').value)">OK</button>
+                        <button data-code="Zone 2 Cure Slope" data-input="inputZ2Slope">OK</button>
                     </div>
                 </div>
             </div>
@@ -1402,7 +1971,7 @@ SETTINGS_TEMPLATE = """
         <!-- Debug Parameters -->
         <div class="card">
             <h2>🔧 Debug - Alla parametrar</h2>
-            <input type="text" class="search-box" id="paramSearch" placeholder="Sök parameter..." oninput="filterParams()">
+            <input type="text" class="search-box" id="paramSearch" placeholder="Sök parameter..." oninput="scheduleFilter()">
             <div style="max-height:500px;overflow-y:auto;">
                 <table class="debug-table">
                     <thead>
@@ -1424,214 +1993,306 @@ SETTINGS_TEMPLATE = """
 
     <div id="message" class="message"></div>
 
+    <script src="/assets/common.js"></script>
     <script>
-        const CONTROL_PASSWORD = 'Mb29661';
-        let passwordVerified = false;
-        let passwordTimeout = null;
         let silentMode = false;
         let pumpPower = true;
-        let allParams = {};
+        // Last known value per parameter
+        const allParams = new Map();
+
+        // Elements looked up once at startup
+        const EL = {
+            search: document.getElementById('paramSearch'),
+            tbody: document.getElementById('paramTableBody'),
+            lastUpdate: document.getElementById('lastUpdate'),
+            silentBtn: document.getElementById('silentBtn'),
+            powerBtn: document.getElementById('powerBtn')
+        };
 
-        function showMessage(text, isError = false) {
-            const msg = document.getElementById('message');
-            msg.textContent = text;
-            msg.className = 'message show' + (isError ? ' error' : '');
-            setTimeout(() => msg.className = 'message', 3000);
+        function toggleSilent() {
+            setParam('hanControl', silentMode ? '0000000000000000' : '0000000000000010');
         }
 
-        function verifyPassword() {
-            const pwd = prompt('⚠️ VARNING: Du är på väg att ändra pumpen.\\n\\nAnge lösenord för att bekräfta:');
-            if (pwd === CONTROL_PASSWORD) {
-                passwordVerified = true;
-                if (passwordTimeout) clearTimeout(passwordTimeout);
-                passwordTimeout = setTimeout(() => { passwordVerified = false; }, 5 * 60 * 1000);
-                return true;
-            } else if (pwd !== null) {
-                showMessage('Fel lösenord!', true);
+        function togglePower() {
+            const newState = pumpPower ? '0' : '1';
+            if (!pumpPower || confirm('Är du säker på att du vill STÄNGA AV pumpen?')) {
+                setParam('Power', newState);
             }
-            return false;
         }
 
-        async function safeSetParam(code, value) {
-            if (!passwordVerified && !verifyPassword()) return;
-            await setParam(code, value);
+        function filterParams() {
+            const search = EL.search.value.toLowerCase();
+            // A match contains every trigram of the query, so only rows in the
+            // smallest trigram set need the substring test
+            let candidates = null;
+            for (let i = 0; i + 3 <= search.length; i++) {
+                const rows = trigramIndex.get(search.substr(i, 3));
+                if (!rows) {
+                    candidates = new Set();
+                    break;
+                }
+                if (!candidates || rows.size < candidates.size) candidates = rows;
+            }
+            for (let i = 0, n = rowList.length; i < n; i++) {
+                const row = rowList[i];
+                const match = (!candidates || candidates.has(row)) && row.dataset.search.includes(search);
+                row.style.display = match ? '' : 'none';
+            }
         }
 
-        function safeToggleSilent() {
-            if (!passwordVerified && !verifyPassword()) return;
-            setParam('hanControl', silentMode ? '0000000000000000' : '0000000000000010');
+        // Filter once typing pauses instead of on every keystroke
+        let filterTimer = null;
+        function scheduleFilter() {
+            clearTimeout(filterTimer);
+            filterTimer = setTimeout(filterParams, 80);
+        }
+
+        // Parameter descriptions
+        const paramNames = {
+            'T01': 'Inkommande vatten',
+            'T02': 'Utgående vatten',
+            'T03': 'Förångargastemp',
+            'T04': 'Utomhustemp',
+            'T05': 'Sugggastemp',
+            'T06': 'Kondensortemp',
+            'T07': 'Bufferttank temp',
+            'T08': 'Tank',
+            'T09': 'Rumstemp',
+            'T10': 'EVI inloppstemp',
+            'T11': 'EVI utloppstemp',
+            'T12': 'Hetgastemp',
+            'T14': 'Spridarrörstemp',
+            'T15': 'Lågtryck',
+            'T33': 'IPM larmtemp',
+            'T34': 'AC inspänning',
+            'T35': 'AC inström',
+            'T36': 'Kompressor fasström',
+            'T37': 'DC styrspänning',
+            'T38': 'IPM temp',
+            'T39': 'Vattenflöde',
+            'T45': 'Högtryck',
+            'T49': 'Förångargastemp',
+            'T50': 'Underkylning',
+            'T51': 'Överhettning',
+            'T52': 'Ström L1',
+            'T53': 'Ström L2',
+            'T54': 'Ström L3',
+            '2054': 'Elförbrukning kW',
+            'compensate_offset': 'AT kurva offset',
+            'compensate_slope': 'AT kurva lutning',
+            'M1 Heating Target': 'Börvärde värme',
+            'M1 Hot Water Target': 'Börvärde varmvatten',
+            'R01': 'Varmvattentemp'
+        };
+
+        // Control inputs fed directly by a status parameter
+        const INPUTS = new Map(Object.entries({
+            'compensate_offset': 'inputCurveOffset',
+            'compensate_slope': 'inputCurveSlope',
+            'R01': 'inputHwTarget',
+            'M1 Heating Target': 'inputM1HeatTarget',
+            'M1 Max. Power': 'inputMaxPower',
+            'CP1-1': 'inputCP1_1',
+            'CP1-2': 'inputCP1_2',
+            'CP1-3': 'inputCP1_3',
+            'CP1-4': 'inputCP1_4',
+            'CP1-5': 'inputCP1_5',
+            'CP1-6': 'inputCP1_6',
+            'CP1-7': 'inputCP1_7',
+            'Zone 2 Curve Offset': 'inputZ2Offset',
+            'Zone 2 Cure Slope': 'inputZ2Slope',
+            'SG Status': 'inputSG'
+        }).map(([key, id]) => [key, document.getElementById(id)]));
+
+        // Debug table rows are built once, then patched in place
+        const valueCells = new Map();
+        const sortedKeys = [];
+        const rowList = [];  // Every row, so filtering needs no DOM query
+
+        // Lowercased once per value change, not per row on every keystroke
+        function searchText(key, value) {
+            return (key + ' ' + (paramNames[key] || '') + ' ' + value).toLowerCase();
+        }
+
+        // Trigram -> rows whose search text contains it
+        const trigramIndex = new Map();
+
+        function indexRow(row, add) {
+            const text = row.dataset.search;
+            for (let i = 0; i + 3 <= text.length; i++) {
+                const gram = text.substr(i, 3);
+                let rows = trigramIndex.get(gram);
+                if (add) {
+                    if (!rows) trigramIndex.set(gram, rows = new Set());
+                    rows.add(row);
+                } else if (rows) {
+                    rows.delete(row);
+                    if (!rows.size) trigramIndex.delete(gram);
+                }
+            }
         }
 
-        function safeTogglePower() {
-            if (!passwordVerified && !verifyPassword()) return;
-            const newState = pumpPower ? '0' : '1';
-            if (!pumpPower || confirm('Är du säker på att du vill STÄNGA AV pumpen?')) {
-                setParam('Power', newState);
+        function createRow(key) {
+            const row = document.createElement('tr');
+            row.dataset.search = searchText(key, allParams.get(key));
+            indexRow(row, true);
+            rowList.push(row);
+            const nameCell = row.insertCell();
+            nameCell.textContent = key;
+            if (paramNames[key]) {
+                const desc = document.createElement('span');
+                desc.style.color = '#888';
+                desc.textContent = `(${paramNames[key]})`;
+                nameCell.append(' ', desc);
+            }
+            const valueCell = row.insertCell();
+            valueCell.textContent = allParams.get(key);
+            valueCells.set(key, valueCell);
+            return row;
+        }
+
+        function insertRow(tbody, key) {
+            let i = sortedKeys.findIndex(k => k > key);
+            if (i < 0) i = sortedKeys.length;
+            const next = i < sortedKeys.length ? valueCells.get(sortedKeys[i]).parentNode : null;
+            tbody.insertBefore(createRow(key), next);
+            sortedKeys.splice(i, 0, key);
+        }
+
+        function updateTable(changed, keys) {
+            const tbody = EL.tbody;
+            if (!valueCells.size) {
+                // First snapshot: build every row off-document and attach once;
+                // the stream sends the keys already sorted
+                sortedKeys.push(...(keys || [...allParams.keys()].sort()));
+                const fragment = document.createDocumentFragment();
+                for (const key of sortedKeys) fragment.appendChild(createRow(key));
+                tbody.replaceChildren(fragment);
+                return;
+            }
+            for (const key in changed) {
+                const cell = valueCells.get(key);
+                if (!cell) {
+                    insertRow(tbody, key);
+                } else if (cell.textContent !== String(changed[key])) {
+                    cell.textContent = changed[key];
+                    const row = cell.parentNode;
+                    indexRow(row, false);
+                    row.dataset.search = searchText(key, changed[key]);
+                    indexRow(row, true);
+                }
             }
         }
 
-        async function setParam(code, value) {
-            try {
-                const res = await fetch('/api/control', {
-                    method: 'POST',
-                    headers: {'Content-Type': 'application/json'},
-                    body: JSON.stringify({code, value: String(value)})
-                });
-                const data = await res.json();
-                if (data.success) {
-                    showMessage('Sparat: ' + code + ' = ' + value);
-                    fetchStatus();
-                } else {
-                    showMessage('Fel', true);
+        // Diffs arriving before the next frame are merged and written together
+        let pendingChanges = null;
+        let pendingKeys = null;
+
+        function applyDiff(changed, keys) {
+            if (keys) pendingKeys = keys;
+            // Full snapshots (fetchStatus) shrink to the values that really changed
+            for (const key in changed) {
+                const value = changed[key];
+                if (allParams.get(key) === value) continue;
+                allParams.set(key, value);
+                if (!pendingChanges) {
+                    pendingChanges = {};
+                    requestAnimationFrame(renderDiff);
                 }
-            } catch (e) {
-                showMessage('Anslutningsfel', true);
+                pendingChanges[key] = value;
             }
         }
 
-        function filterParams() {
-            const search = document.getElementById('paramSearch').value.toLowerCase();
-            const rows = document.querySelectorAll('#paramTableBody tr');
-            rows.forEach(row => {
-                const text = row.textContent.toLowerCase();
-                row.style.display = text.includes(search) ? '' : 'none';
-            });
-        }
+        function renderDiff() {
+            const changed = pendingChanges;
+            const keys = pendingKeys;
+            pendingChanges = pendingKeys = null;
 
-        async function fetchStatus() {
-            try {
-                const res = await fetch('/api/status');
-                const data = await res.json();
-                allParams = data;
-
-                // Update controls with current values
-                document.getElementById('inputCurveOffset').value = data.compensate_offset || '';
-                document.getElementById('inputCurveSlope').value = data.compensate_slope || '';
-                document.getElementById('inputHwTarget').value = data.R01 || '';
-                document.getElementById('inputM1HeatTarget').value = data['M1 Heating Target'] || '';
-                document.getElementById('inputMaxPower').value = data['M1 Max. Power'] || '';
-                document.getElementById('inputCP1_1').value = data['CP1-1'] || '';
-                document.getElementById('inputCP1_2').value = data['CP1-2'] || '';
-                document.getElementById('inputCP1_3').value = data['CP1-3'] || '';
-                document.getElementById('inputCP1_4').value = data['CP1-4'] || '';
-                document.getElementById('inputCP1_5').value = data['CP1-5'] || '';
-                document.getElementById('inputCP1_6').value = data['CP1-6'] || '';
-                document.getElementById('inputCP1_7').value = data['CP1-7'] || '';
-                document.getElementById('inputZ2Offset').value = data['Zone 2 Curve Offset'] || '';
-                document.getElementById('inputZ2Slope').value = data['Zone 2 Cure Slope'] || '';
-                document.getElementById('inputSG').value = data['SG Status'] || '0';
-
-                // Silent mode
-                silentMode = data.hanControl === '0000000000000010';
-                const silentBtn = document.getElementById('silentBtn');
+            // Update only the controls whose parameter changed
+            for (const key in changed) {
+                const input = INPUTS.get(key);
+                if (input) input.value = changed[key] || (key === 'SG Status' ? '0' : '');
+            }
+
+            // Silent mode
+            if ('hanControl' in changed) {
+                silentMode = changed.hanControl === '0000000000000010';
+                const silentBtn = EL.silentBtn;
                 silentBtn.textContent = silentMode ? 'PÅ' : 'AV';
                 silentBtn.className = 'toggle ' + (silentMode ? 'active' : 'inactive');
+            }
 
-                // Power state
-                pumpPower = data.Power === '1';
-                const powerBtn = document.getElementById('powerBtn');
+            // Power state
+            if ('Power' in changed) {
+                pumpPower = changed.Power === '1';
+                const powerBtn = EL.powerBtn;
                 powerBtn.textContent = pumpPower ? 'PÅ' : 'AV';
                 powerBtn.className = 'toggle ' + (pumpPower ? 'active' : 'inactive');
+            }
 
-                // Parameter descriptions
-                const paramNames = {
-                    'T01': 'Inkommande vatten',
-                    'T02': 'Utgående vatten',
-                    'T03': 'Förångargastemp',
-                    'T04': 'Utomhustemp',
-                    'T05': 'Sugggastemp',
-                    'T06': 'Kondensortemp',
-                    'T07': 'Bufferttank temp',
-                    'T08': 'Tank',
-                    'T09': 'Rumstemp',
-                    'T10': 'EVI inloppstemp',
-                    'T11': 'EVI utloppstemp',
-                    'T12': 'Hetgastemp',
-                    'T14': 'Spridarrörstemp',
-                    'T15': 'Lågtryck',
-                    'T33': 'IPM larmtemp',
-                    'T34': 'AC inspänning',
-                    'T35': 'AC inström',
-                    'T36': 'Kompressor fasström',
-                    'T37': 'DC styrspänning',
-                    'T38': 'IPM temp',
-                    'T39': 'Vattenflöde',
-                    'T45': 'Högtryck',
-                    'T49': 'Förångargastemp',
-                    'T50': 'Underkylning',
-                    'T51': 'Överhettning',
-                    'T52': 'Ström L1',
-                    'T53': 'Ström L2',
-                    'T54': 'Ström L3',
-                    '2054': 'Elförbrukning kW',
-                    'compensate_offset': 'AT kurva offset',
-                    'compensate_slope': 'AT kurva lutning',
-                    'M1 Heating Target': 'Börvärde värme',
-                    'M1 Hot Water Target': 'Börvärde varmvatten',
-                    'R01': 'Varmvattentemp'
-                };
+            // Debug table: touch only the cells whose value changed
+            updateTable(changed, keys);
 
-                // Debug table
-                const tbody = document.getElementById('paramTableBody');
-                const sortedKeys = Object.keys(data).sort();
-                tbody.innerHTML = sortedKeys.map(key => {
-                    const desc = paramNames[key] ? ` <span style="color:#888">(${paramNames[key]})</span>` : '';
-                    return `<tr><td>${key}${desc}</td><td>${data[key]}</td></tr>`;
-                }).join('');
+            EL.lastUpdate.textContent = new Date().toLocaleTimeString();
 
-                document.getElementById('lastUpdate').textContent = new Date().toLocaleTimeString();
+            // Re-apply filter
+            filterParams();
+        }
 
-                // Re-apply filter
-                filterParams();
+        async function fetchStatus() {
+            try {
+                const res = await fetch('/api/status');
+                applyDiff(await res.json());
             } catch (e) {
                 console.error('Fetch error:', e);
             }
         }
 
-        // Initial load and refresh every 30 seconds
-        fetchStatus();
-        setInterval(fetchStatus, 30000);
+        // One listener for every OK button: data-code names the parameter,
+        // data-input the field holding the new value
+        document.querySelectorAll('.controls').forEach(controls => controls.addEventListener('click', e => {
+            const btn = e.target.closest('button[data-code]');
+            if (btn) setParam(btn.dataset.code, document.getElementById(btn.dataset.input).value);
+        }));
+
+        // Server pushes the full snapshot on connect, then only changed parameters.
+        // Hidden tabs drop the stream so they hold no server thread.
+        // The server refuses streams beyond its limit with a 503, which EventSource
+        // does not retry; the tab then polls until it is shown again.
+        let statusStream = null;
+        let statusPoll = null;
+
+        function connectStream() {
+            clearInterval(statusPoll);
+            statusPoll = null;
+            if (document.visibilityState !== 'visible') {
+                if (statusStream) statusStream.close();
+                statusStream = null;
+            } else if (!statusStream) {
+                const stream = statusStream = new EventSource('/api/status/stream');
+                stream.onmessage = e => {
+                    const msg = JSON.parse(e.data);
+                    applyDiff(msg.changed, msg.keys);
+                };
+                stream.onerror = () => {
+                    if (stream.readyState !== EventSource.CLOSED || stream !== statusStream) return;
+                    statusStream = null;
+                    fetchStatus();
+                    statusPoll = setInterval(fetchStatus, 30000);
+                };
+            }
+        }
+
+        document.addEventListener('visibilitychange', connectStream);
+        connectStream();
     </script>
 </body>
 </html>
 """
 
-HTML_TEMPLATE = """
-<!DOCTYPE html>
-<html lang="sv">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Perifal LV-418 Dashboard</title>
-    <script src="https://cdn.jsdelivr.net/npm/chart.js"></script>
-    <script src="https://cdn.jsdelivr.net/npm/chartjs-adapter-date-fns"></script>
-    <style>
-        * { box-sizing: border-box; margin: 0; padding: 0; }
-        body {
-            font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, sans-serif;
-            background: linear-gradient(135deg, #0f0f1a 0%, #1a1a2e 50%, #16213e 100%);
-            color: #fff;
-            min-height: 100vh;
-            padding: 15px;
-        }
+DASHBOARD_STYLE = """
         .container { max-width: 1400px; margin: 0 auto; }
 
-        header {
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-            margin-bottom: 20px;
-            flex-wrap: wrap;
-            gap: 10px;
-        }
-        h1 { font-size: 1.5em; }
-        .badges { display: flex; gap: 8px; flex-wrap: wrap; }
-        .badge {
-            padding: 5px 12px;
-            border-radius: 15px;
-            font-size: 0.8em;
-            font-weight: 500;
-        }
         .badge.online { background: #00c853; }
         .badge.offline { background: #ff5252; }
         .badge.heating { background: #ff7043; }
@@ -1652,13 +2313,6 @@ HTML_TEMPLATE = """
             grid-template-columns: 1fr;
         }
 
-        .card {
-            background: rgba(255,255,255,0.08);
-            border-radius: 12px;
-            padding: 15px;
-            backdrop-filter: blur(10px);
-            border: 1px solid rgba(255,255,255,0.1);
-        }
         .card h2 {
             font-size: 0.9em;
             margin-bottom: 12px;
@@ -1810,6 +2464,12 @@ HTML_TEMPLATE = """
         .pump-status.wood { background: rgba(141,110,99,0.3); border: 1px solid #8d6e63; }
         .pump-status h3 { font-size: 1.1em; margin-bottom: 5px; }
         .pump-status p { font-size: 0.85em; color: #aaa; }
+        #pumpActive { color: #4caf50; }
+        #pumpActive.resting { color: #ff9800; }
+
+        /* State badges follow the classes renderStatus() sets on <body> */
+        #compBadge, #woodBadge, #silentBadge { display: none; }
+        .pump-running #compBadge, .pump-wood #woodBadge, .silent-on #silentBadge { display: inline-block; }
 
         .update-info {
             text-align: center;
@@ -1831,7 +2491,6 @@ HTML_TEMPLATE = """
             z-index: 100;
             font-size: 0.9em;
         }
-        .message.error { background: #ff5252; }
         .message.show { display: block; }
 
         @media (max-width: 600px) {
@@ -1839,188 +2498,35 @@ HTML_TEMPLATE = """
             .cop-value { font-size: 2.5em; }
             .chart-container { height: 250px; }
         }
-    </style>
-</head>
-<body>
-    <div class="container">
-        <header>
-            <h1>🔥 Perifal LV-418</h1>
-            <div class="badges">
-                <span id="statusBadge" class="badge online">ONLINE</span>
-                <span id="modeBadge" class="badge heating">VÄRME</span>
-                <span id="compBadge" class="badge compressor" style="display:none">KOMPRESSOR</span>
-                <span id="woodBadge" class="badge wood" style="display:none">VEDELDNING</span>
-                <span id="silentBadge" class="badge silent" style="display:none">TYST</span>
-                <a href="/settings" target="_blank" class="badge" style="background:#7c4dff;text-decoration:none;cursor:pointer">INSTÄLLNINGAR</a>
-                <a href="/logout" class="badge" style="background:#546e7a;text-decoration:none;cursor:pointer">LOGGA UT</a>
-            </div>
-        </header>
+"""
 
-        <!-- Pump status indicator -->
-        <div id="pumpStatus" class="pump-status running">
-            <h3 id="pumpStatusTitle">🟢 Värmepump aktiv</h3>
-            <p id="pumpStatusDesc">Kompressorn körs</p>
-        </div>
+DASHBOARD_SCRIPT = """
+        let sessionStart = Date.now();
+        let totalEnergy = 0;
+        let totalHeat = 0;
+        let copReadings = [];
+        let silentMode = false;
+        let pumpPower = true;
+        let chart = null;
+        let energyChart = null;
 
-        <div class="grid">
-            <!-- COP Card -->
-            <div class="card">
-                <h2>⚡ Effektivitet</h2>
-                <div class="cop-display">
-                    <div class="cop-value" id="copValue">--</div>
-                    <div class="cop-label">COP (Coefficient of Performance)</div>
-                </div>
-                <div class="cop-details">
-                    <div class="cop-detail">
-                        <div class="cop-detail-value" id="powerIn">--</div>
-                        <div class="cop-detail-label">El in (kW)</div>
-                    </div>
-                    <div class="cop-detail">
-                        <div class="cop-detail-value" id="powerOut">--</div>
-                        <div class="cop-detail-label">Värme ut (kW)</div>
-                    </div>
-                    <div class="cop-detail">
-                        <div class="cop-detail-value" id="deltaT">--</div>
-                        <div class="cop-detail-label">ΔT (°C)</div>
-                    </div>
-                    <div class="cop-detail">
-                        <div class="cop-detail-value" id="compFreq">--</div>
-                        <div class="cop-detail-label">Kompressor %</div>
-                    </div>
-                </div>
-            </div>
+        // Elements written by the periodic refreshes, looked up once
+        const EL = Object.fromEntries([
+            'tempOutdoor', 'tempFlow', 'tempIngåenden', 'tempTank', 'tempComp', 'tempEvap', 'calcTarget',
+            'copValue', 'powerIn', 'powerOut', 'deltaT', 'compFreq', 'pumpActive', 'pumpStatus',
+            'pumpStatusTitle', 'pumpStatusDesc', 'modeBadge', 'lastUpdate', 'dbStatus', 'historyChart', 'historyRange', 'customDateRange', 'dateFrom', 'dateTo',
+            'energyChart', 'energyToday', 'energy24h', 'energy7d', 'energyTotal', 'woodHours', 'woodSessions'
+        ].map(id => [id, document.getElementById(id)]));
 
-            <!-- Temperatures & Stats -->
-            <div class="card">
-                <h2>🌡️ Temperaturer & Driftdata</h2>
-                <div class="temps">
-                    <div class="temp-item temp-outdoor">
-                        <div class="temp-value" id="tempOutdoor">--</div>
-                        <div class="temp-label">Utomhus</div>
-                    </div>
-                    <div class="temp-item temp-flow">
-                        <div class="temp-value" id="tempFlow">--</div>
-                        <div class="temp-label">Utgående</div>
-                    </div>
-                    <div class="temp-item temp-return">
-                        <div class="temp-value" id="tempIngåenden">--</div>
-                        <div class="temp-label">Ingående</div>
-                    </div>
-                    <div class="temp-item temp-tank">
-                        <div class="temp-value" id="tempTank">--</div>
-                        <div class="temp-label">Ackumulatortank</div>
-                    </div>
-                    <div class="temp-item temp-comp">
-                        <div class="temp-value" id="tempComp">--</div>
-                        <div class="temp-label">Kompressor</div>
-                    </div>
-                    <div class="temp-item temp-evap">
-                        <div class="temp-value" id="tempEvap">--</div>
-                        <div class="temp-label">Förångare</div>
-                    </div>
-                </div>
-                <div class="stats" style="grid-template-columns: repeat(2, 1fr); margin-top: 15px;">
-                    <div class="stat-item">
-                        <div class="stat-value" id="pumpActive" style="color:#4caf50;">--</div>
-                        <div class="stat-label">Pump</div>
-                    </div>
-                    <div class="stat-item">
-                        <div class="stat-value" id="calcTarget">--</div>
-                        <div class="stat-label">Börvärde</div>
-                    </div>
-                </div>
-                <div class="stats" style="grid-template-columns: 1fr; margin-top: 10px;">
-                    <div class="stat-item" style="background: rgba(141, 110, 99, 0.3);">
-                        <div class="stat-value" style="color:#8d6e63;"><span id="woodHours">--</span> / <span id="woodSessions">--</span></div>
-                        <div class="stat-label">🪵 Eldning senaste 7 dygn (timmar / tillfällen)</div>
-                        <button id="importBtn" onclick="importHistory()" style="margin-top:8px; padding:4px 12px; font-size:11px; background:#444; color:#aaa; border:1px solid #555; border-radius:4px; cursor:pointer;">Importera 72h historik</button>
-                    </div>
-                </div>
-            </div>
+        // Unchanged values are not rewritten, so the browser has nothing to re-layout
+        function setText(el, text) {
+            text = String(text);
+            if (el.textContent !== text) el.textContent = text;
+        }
 
-        </div>
-
-        <!-- Historical Chart -->
-        <div class="card">
-            <h2>📈 Historik</h2>
-            <div class="chart-controls">
-                <label>Visa:</label>
-                <select id="historyRange" onchange="loadHistory()">
-                    <option value="1">Senaste timmen</option>
-                    <option value="6">6 timmar</option>
-                    <option value="24" selected>24 timmar</option>
-                    <option value="72">3 dagar</option>
-                    <option value="168">7 dagar</option>
-                    <option value="custom">Anpassat...</option>
-                </select>
-                <div id="customDateRange" style="display:none;">
-                    <input type="date" id="dateFrom">
-                    <span>till</span>
-                    <input type="date" id="dateTo">
-                    <button onclick="loadHistory()">Hämta</button>
-                </div>
-                <label style="margin-left:15px;">Visa:</label>
-                <select id="chartDataset" onchange="updateChartVisibility()">
-                    <option value="all">Alla</option>
-                    <option value="temps">Temperaturer</option>
-                    <option value="cop">COP & Effekt</option>
-                </select>
-            </div>
-            <div class="chart-container">
-                <canvas id="historyChart"></canvas>
-            </div>
-        </div>
-
-        <!-- Energy Statistics -->
-        <div class="card">
-            <h2>⚡ Elförbrukning</h2>
-            <div class="stats" style="grid-template-columns: repeat(4, 1fr);">
-                <div class="stat-item">
-                    <div class="stat-value" id="energyToday">--</div>
-                    <div class="stat-label">Idag (kWh)</div>
-                </div>
-                <div class="stat-item">
-                    <div class="stat-value" id="energy24h">--</div>
-                    <div class="stat-label">24h (kWh)</div>
-                </div>
-                <div class="stat-item">
-                    <div class="stat-value" id="energy7d">--</div>
-                    <div class="stat-label">7 dagar (kWh)</div>
-                </div>
-                <div class="stat-item">
-                    <div class="stat-value" id="energyTotal">--</div>
-                    <div class="stat-label">Totalt (kWh)</div>
-                </div>
-            </div>
-            <div class="chart-container" style="height:200px;margin-top:15px;">
-                <canvas id="energyChart"></canvas>
-            </div>
-        </div>
-
-        <div class="update-info">
-            Live-data var 10s | Historik från molnet | Senast: <span id="lastUpdate">--</span>
-            <br><span id="dbStatus" style="color:#666">Moln: kontrollerar...</span>
-        </div>
-    </div>
-
-    <div id="message" class="message"></div>
-
-    <script>
-        let sessionStart = Date.now();
-        let totalEnergy = 0;
-        let totalHeat = 0;
-        let copReadings = [];
-        let silentMode = false;
-        let pumpPower = true;
-        let chart = null;
-        let energyChart = null;
-
-        function showMessage(text, isError = false) {
-            const msg = document.getElementById('message');
-            msg.textContent = text;
-            msg.className = 'message show' + (isError ? ' error' : '');
-            setTimeout(() => msg.className = 'message', 3000);
-        }
+        function setClass(el, className) {
+            if (el.className !== className) el.className = className;
+        }
 
         function calculateCOP(data) {
             const powerIn = parseFloat(data['2054']) || 0;  // 2054 = Electrical power (kW)
@@ -2038,30 +2544,38 @@ HTML_TEMPLATE = """
         }
 
         function initChart() {
-            const ctx = document.getElementById('historyChart').getContext('2d');
+            const ctx = EL.historyChart.getContext('2d');
             chart = new Chart(ctx, {
                 type: 'line',
                 data: {
                     datasets: [
-                        { label: 'Utgående', data: [], borderColor: '#ef5350', borderWidth: 1.5, pointRadius: 0, tension: 0.3 },
-                        { label: 'Utomhus', data: [], borderColor: '#64b5f6', borderWidth: 1.5, pointRadius: 0, tension: 0.3 },
-                        { label: 'Tank', data: [], borderColor: '#ce93d8', borderWidth: 1.5, pointRadius: 0, tension: 0.3 },
-                        { label: 'COP', data: [], borderColor: '#4caf50', borderWidth: 2, pointRadius: 0, tension: 0.3 },
-                        { label: 'El kW', data: [], borderColor: '#ffca28', borderWidth: 1.5, pointRadius: 0, tension: 0.3 }
+                        { label: 'Utgående', data: [], borderColor: '#ef5350', borderWidth: 1.5, pointRadius: 0 },
+                        { label: 'Utomhus', data: [], borderColor: '#64b5f6', borderWidth: 1.5, pointRadius: 0 },
+                        { label: 'Tank', data: [], borderColor: '#ce93d8', borderWidth: 1.5, pointRadius: 0 },
+                        { label: 'COP', data: [], borderColor: '#4caf50', borderWidth: 2, pointRadius: 0, yAxisID: 'y1' },
+                        { label: 'El kW', data: [], borderColor: '#ffca28', borderWidth: 1.5, pointRadius: 0, yAxisID: 'y1' }
                     ]
                 },
                 options: {
                     responsive: true,
+                    resizeDelay: 150,  // Redraw once resizing settles
                     maintainAspectRatio: false,
+                    // Points arrive as sorted {x: epoch ms, y}; skip parsing and sorting.
+                    // Null readings are left out by the server, so lines bridge them
+                    parsing: false,
+                    normalized: true,
+                    spanGaps: true,
+                    animations: { colors: false, x: false },
                     interaction: { intersect: false, mode: 'index' },
                     plugins: {
+                        // Samples to the canvas width if a series still exceeds it
+                        decimation: { enabled: true, algorithm: 'lttb' },
                         legend: { labels: { color: '#90caf9', boxWidth: 12, font: { size: 10 } } },
                         tooltip: { callbacks: {
                             label: ctx => {
                                 let val = ctx.parsed.y;
-                                // COP and kW are scaled ×4, show actual values
-                                if (ctx.datasetIndex === 3) return 'COP: ' + (val / 4).toFixed(2);
-                                if (ctx.datasetIndex === 4) return 'El: ' + (val / 4).toFixed(1) + ' kW';
+                                if (ctx.datasetIndex === 3) return 'COP: ' + val.toFixed(2);
+                                if (ctx.datasetIndex === 4) return 'El: ' + val.toFixed(1) + ' kW';
                                 return ctx.dataset.label + ': ' + (val?.toFixed(1) || '--') + '°C';
                             }
                         }}
@@ -2107,20 +2621,18 @@ HTML_TEMPLATE = """
                             grid: { color: 'rgba(255,255,255,0.05)' },
                             title: { display: true, text: '°C', color: '#666' }
                         },
+                        // COP and kW at a quarter of the °C scale, so 0-5 fits under 20°C
                         y1: {
                             type: 'linear',
                             display: true,
                             position: 'right',
-                            min: -10,
-                            max: 60,
+                            min: -2.5,
+                            max: 15,
                             ticks: {
-                                stepSize: 4,
+                                stepSize: 1,
                                 color: '#ffca28',
                                 callback: function(value) {
-                                    if (value >= 0 && value <= 20 && value % 4 === 0) {
-                                        return value / 4;
-                                    }
-                                    return '';
+                                    return value >= 0 && value <= 5 ? value : '';
                                 }
                             },
                             grid: { drawOnChartArea: false },
@@ -2131,14 +2643,15 @@ HTML_TEMPLATE = """
             });
         }
 
-        async function loadHistory() {
-            const range = document.getElementById('historyRange').value;
-            const customDiv = document.getElementById('customDateRange');
+        // Periodic refreshes redraw without animation; only user-picked ranges animate
+        async function loadHistory(animate = false) {
+            const range = EL.historyRange.value;
+            const customDiv = EL.customDateRange;
 
             if (range === 'custom') {
                 customDiv.style.display = 'flex';
-                const from = document.getElementById('dateFrom').value;
-                const to = document.getElementById('dateTo').value;
+                const from = EL.dateFrom.value;
+                const to = EL.dateTo.value;
                 if (!from || !to) return;
             } else {
                 customDiv.style.display = 'none';
@@ -2147,44 +2660,39 @@ HTML_TEMPLATE = """
             let url = '/api/history?hours=' + range;
 
             if (range === 'custom') {
-                const from = document.getElementById('dateFrom').value;
-                const to = document.getElementById('dateTo').value;
+                const from = EL.dateFrom.value;
+                const to = EL.dateTo.value;
                 url = '/api/history?from=' + from + '&to=' + to;
             }
+            // The server downsamples to what the canvas can show
+            url += '&max_points=' + Math.ceil(EL.historyChart.clientWidth * 2);
 
             try {
                 const res = await fetch(url);
                 const data = await res.json();
 
-                if (data.readings && data.readings.length > 0) {
+                if (data.series && data.count > 0) {
                     const source = data.source === 'cloud' ? 'Moln' : 'Databas';
-                    document.getElementById('dbStatus').textContent = source + ': ' + data.readings.length + ' mätpunkter';
-
-                    // Update chart datasets
-                    chart.data.datasets[0].data = data.readings
-                        .filter(r => r.t02_flow !== null)
-                        .map(r => ({x: new Date(r.timestamp), y: r.t02_flow}));
-                    chart.data.datasets[1].data = data.readings
-                        .filter(r => r.t04_outdoor !== null)
-                        .map(r => ({x: new Date(r.timestamp), y: r.t04_outdoor}));
-                    chart.data.datasets[2].data = data.readings
-                        .filter(r => r.t06 !== null)
-                        .map(r => ({x: new Date(r.timestamp), y: r.t06}));
-                    // COP and power scaled ×4 to fit under 20, right axis shows actual values
-                    chart.data.datasets[3].data = data.readings
-                        .filter(r => r.cop_calculated !== null && r.cop_calculated <= 5.0)
-                        .map(r => ({x: new Date(r.timestamp), y: Math.min(r.cop_calculated, 5.0) * 4}));
-                    chart.data.datasets[4].data = data.readings
-                        .filter(r => r.t39_power_kw !== null)
-                        .map(r => ({x: new Date(r.timestamp), y: r.t39_power_kw * 4}));
-
-                    chart.update();
+                    setText(EL.dbStatus, source + ': ' + data.count + ' mätpunkter');
+
+                    // Series arrive as ready {x, y} points, already downsampled;
+                    // only the timestamps are converted, in place
+                    for (const points of Object.values(data.series)) {
+                        for (const p of points) p.x = Date.parse(p.x);
+                    }
+                    chart.data.datasets[0].data = data.series.t02_flow;
+                    chart.data.datasets[1].data = data.series.t04_outdoor;
+                    chart.data.datasets[2].data = data.series.t06;
+                    chart.data.datasets[3].data = data.series.cop_calculated;
+                    chart.data.datasets[4].data = data.series.t39_power_kw;
+
+                    chart.update(animate ? undefined : 'none');
                 } else {
-                    document.getElementById('dbStatus').textContent = 'Moln: ingen historik tillgänglig';
+                    setText(EL.dbStatus, 'Moln: ingen historik tillgänglig');
                 }
             } catch (e) {
                 console.error('History fetch error:', e);
-                document.getElementById('dbStatus').textContent = 'Moln: fel vid hämtning';
+                setText(EL.dbStatus, 'Moln: fel vid hämtning');
             }
         }
 
@@ -2208,180 +2716,162 @@ HTML_TEMPLATE = """
             chart.update();
         }
 
+        // Latest value of every parameter, merged from snapshots and pushed changes
+        const status = {};
+        let renderPending = false;
+
+        function applyStatus(changed) {
+            Object.assign(status, changed);
+            // Apply every DOM write in a single frame, once per frame
+            if (!renderPending) {
+                renderPending = true;
+                requestAnimationFrame(() => {
+                    renderPending = false;
+                    renderStatus(status);
+                });
+            }
+        }
+
+        // One-off refresh, e.g. right after a control change
         async function fetchStatus() {
             try {
                 const res = await fetch('/api/status');
-                const data = await res.json();
-
-                // Temperatures
-                const t04 = parseFloat(data.T04) || 0;
-                const t02 = parseFloat(data.T02) || 0;
-                const t01 = parseFloat(data.T01) || 0;
-                const t11 = parseFloat(data.T11) || 0;
-                const t08 = parseFloat(data.T08) || 0;  // Tank temp
-                const t03 = parseFloat(data.T03) || 0;
-                const powerKW = parseFloat(data['2054']) || 0;  // 2054 = Electrical power kW
-                const t33 = parseFloat(data.T33) || 0;
-                const heatTarget = parseFloat(data['M1 Heating Target']) || 0;
-
-                document.getElementById('tempOutdoor').textContent = t04.toFixed(1) + '°';
-                document.getElementById('tempFlow').textContent = t02.toFixed(1) + '°';
-                document.getElementById('tempIngåenden').textContent = t01.toFixed(1) + '°';
-                document.getElementById('tempTank').textContent = t08.toFixed(1) + '°';
-                document.getElementById('tempComp').textContent = (parseFloat(data.T12) || 0).toFixed(1) + '°';
-                document.getElementById('tempEvap').textContent = t03.toFixed(1) + '°';
-
-                // Driftdata - interpolate target from curve points
-                // Kurvan: -20°C, -10°C, -5°C, 0°C, 5°C, 10°C, 20°C
-                const outdoorTemps = [-20, -10, -5, 0, 5, 10, 20];
-                const curveTemps = [
-                    parseFloat(data['CP1-1']) || 53,
-                    parseFloat(data['CP1-2']) || 45,
-                    parseFloat(data['CP1-3']) || 45,
-                    parseFloat(data['CP1-4']) || 38,
-                    parseFloat(data['CP1-5']) || 35,
-                    parseFloat(data['CP1-6']) || 25,
-                    parseFloat(data['CP1-7']) || 20
-                ];
-
-                // Interpolate target temp based on current outdoor temp
-                let calcTarget = curveTemps[0];
-                for (let i = 0; i < outdoorTemps.length - 1; i++) {
-                    if (t04 >= outdoorTemps[i] && t04 <= outdoorTemps[i + 1]) {
-                        const ratio = (t04 - outdoorTemps[i]) / (outdoorTemps[i + 1] - outdoorTemps[i]);
-                        calcTarget = curveTemps[i] + ratio * (curveTemps[i + 1] - curveTemps[i]);
-                        break;
-                    } else if (t04 < outdoorTemps[0]) {
-                        calcTarget = curveTemps[0];
-                    } else if (t04 > outdoorTemps[outdoorTemps.length - 1]) {
-                        calcTarget = curveTemps[curveTemps.length - 1];
-                    }
-                }
-
-                document.getElementById('calcTarget').textContent = calcTarget.toFixed(1) + '°C';
-
-                // COP
-                const copData = calculateCOP(data);
-                document.getElementById('copValue').textContent = copData.cop > 0 ? copData.cop.toFixed(2) : '--';
-                document.getElementById('powerIn').textContent = copData.powerIn.toFixed(2);
-                document.getElementById('powerOut').textContent = copData.heatPower > 0 ? copData.heatPower.toFixed(1) : '--';
-                document.getElementById('deltaT').textContent = copData.deltaT.toFixed(1);
-                document.getElementById('compFreq').textContent = t33.toFixed(0);
-
-                // Pump active status
-                const pumpActiveEl = document.getElementById('pumpActive');
-                if (t33 > 5 || powerKW > 0.2) {
-                    pumpActiveEl.textContent = 'AKTIV';
-                    pumpActiveEl.style.color = '#4caf50';
-                } else {
-                    pumpActiveEl.textContent = 'VILAR';
-                    pumpActiveEl.style.color = '#ff9800';
-                }
-
-                // Pump status - detect if pump is stopped due to high tank temp (wood heating)
-                const pumpStatus = document.getElementById('pumpStatus');
-                const statusTitle = document.getElementById('pumpStatusTitle');
-                const statusDesc = document.getElementById('pumpStatusDesc');
-                const woodBadge = document.getElementById('woodBadge');
-                const compBadge = document.getElementById('compBadge');
-
-                const compRunning = powerKW > 0.2 || t33 > 10;
-                const tankAboveTarget = t08 > heatTarget || t01 > heatTarget;
-
-                if (!compRunning && tankAboveTarget) {
-                    // Wood heating detected - tank temp above target
-                    pumpStatus.className = 'pump-status wood';
-                    statusTitle.textContent = '🪵 Vedeldning detekterad';
-                    statusDesc.textContent = 'Tank: ' + t08.toFixed(1) + '°C > Börvärde: ' + heatTarget.toFixed(0) + '°C - Pumpen vilar';
-                    woodBadge.style.display = 'inline-block';
-                    compBadge.style.display = 'none';
-                } else if (compRunning) {
-                    pumpStatus.className = 'pump-status running';
-                    statusTitle.textContent = '🟢 Värmepump aktiv';
-                    statusDesc.textContent = 'Kompressor: ' + t33.toFixed(0) + '% | Effekt: ' + powerKW.toFixed(2) + ' kW';
-                    woodBadge.style.display = 'none';
-                    compBadge.style.display = 'inline-block';
-                } else {
-                    pumpStatus.className = 'pump-status stopped';
-                    statusTitle.textContent = '🔴 Värmepump stannad';
-                    statusDesc.textContent = 'Kompressorn är av';
-                    woodBadge.style.display = 'none';
-                    compBadge.style.display = 'none';
-                }
-
-                // Mode badge
-                const modeBadge = document.getElementById('modeBadge');
-                const mode = data.Mode;
-                modeBadge.textContent = mode === '1' ? 'VÄRME' : mode === '2' ? 'KYLA' : mode === '3' ? 'VV' : 'LÄGE ' + mode;
-                modeBadge.className = 'badge ' + (mode === '1' ? 'heating' : mode === '3' ? 'hotwater' : 'idle');
-
-                // Silent mode badge
-                silentMode = data.hanControl && data.hanControl.includes('1');
-                document.getElementById('silentBadge').style.display = silentMode ? 'inline-block' : 'none';
-
-                // Power state
-                pumpPower = data.Power === '1';
-
-                document.getElementById('lastUpdate').textContent = new Date().toLocaleTimeString('sv-SE');
-
+                applyStatus(await res.json());
             } catch (e) {
                 console.error('Fetch error:', e);
             }
         }
 
-        const CONTROL_PASSWORD = 'Mb29661';  // Same as login password
-        let passwordVerified = false;
-        let passwordTimeout = null;
-
-        function verifyPassword() {
-            const pwd = prompt('⚠️ VARNING: Du är på väg att ändra pumpen.\\n\\nAnge lösenord för att bekräfta:');
-            if (pwd === CONTROL_PASSWORD) {
-                passwordVerified = true;
-                // Password valid for 5 minutes
-                if (passwordTimeout) clearTimeout(passwordTimeout);
-                passwordTimeout = setTimeout(() => { passwordVerified = false; }, 5 * 60 * 1000);
-                return true;
-            } else if (pwd !== null) {
-                showMessage('Fel lösenord!', true);
+        // The server pushes the full snapshot on connect, then only changed parameters,
+        // batched with the wood-heating stats into one message per update.
+        // Hidden tabs drop the stream so they hold no server thread.
+        // The server refuses streams beyond its limit with a 503, which EventSource
+        // does not retry; the tab then polls until it is shown again.
+        let statusStream = null;
+        let statusPolls = [];
+
+        function connectStream() {
+            statusPolls.forEach(clearInterval);
+            statusPolls = [];
+            if (document.visibilityState !== 'visible') {
+                if (statusStream) statusStream.close();
+                statusStream = null;
+            } else if (!statusStream) {
+                const stream = statusStream = new EventSource('/api/status/stream?wood=1');
+                stream.onmessage = e => {
+                    const msg = JSON.parse(e.data);
+                    if (msg.changed) applyStatus(msg.changed);
+                    if (msg.wood) renderWood(msg.wood);
+                };
+                stream.onerror = () => {
+                    if (stream.readyState !== EventSource.CLOSED || stream !== statusStream) return;
+                    statusStream = null;
+                    fetchStatus();
+                    loadWoodStats();
+                    statusPolls = [setInterval(fetchStatus, 10000), setInterval(loadWoodStats, 300000)];
+                };
             }
-            return false;
         }
 
-        async function safeSetParam(code, value) {
-            if (!passwordVerified && !verifyPassword()) return;
-            await setParam(code, value);
-        }
+        // Heating curve CP1-1..CP1-7 at -20°C, -10°C, -5°C, 0°C, 5°C, 10°C, 20°C
+        const CURVE_OUTDOOR = [-20, -10, -5, 0, 5, 10, 20];
+        const CURVE_DEFAULTS = [53, 45, 45, 38, 35, 25, 20];
+        let curveKey = null;
+        let curve = CURVE_DEFAULTS;
+        let curveSlopes = [];
+
+        // Target flow temperature at outdoor temp t04; slopes are recomputed
+        // only when the curve settings change
+        function curveTarget(data, t04) {
+            const key = CURVE_OUTDOOR.map((_, i) => data['CP1-' + (i + 1)]).join();
+            if (key !== curveKey) {
+                curveKey = key;
+                curve = CURVE_DEFAULTS.map((d, i) => parseFloat(data['CP1-' + (i + 1)]) || d);
+                curveSlopes = curve.slice(1).map((c, i) =>
+                    (c - curve[i]) / (CURVE_OUTDOOR[i + 1] - CURVE_OUTDOOR[i]));
+            }
+            const last = CURVE_OUTDOOR.length - 1;
+            if (t04 <= CURVE_OUTDOOR[0]) return curve[0];
+            if (t04 >= CURVE_OUTDOOR[last]) return curve[last];
+            let i = 0;
+            while (t04 > CURVE_OUTDOOR[i + 1]) i++;
+            return curve[i] + curveSlopes[i] * (t04 - CURVE_OUTDOOR[i]);
+        }
+
+        function renderStatus(data) {
+            // Temperatures
+            const t04 = parseFloat(data.T04) || 0;
+            const t02 = parseFloat(data.T02) || 0;
+            const t01 = parseFloat(data.T01) || 0;
+            const t11 = parseFloat(data.T11) || 0;
+            const t08 = parseFloat(data.T08) || 0;  // Tank temp
+            const t03 = parseFloat(data.T03) || 0;
+            const powerKW = parseFloat(data['2054']) || 0;  // 2054 = Electrical power kW
+            const t33 = parseFloat(data.T33) || 0;
+            const heatTarget = parseFloat(data['M1 Heating Target']) || 0;
+
+            setText(EL.tempOutdoor, t04.toFixed(1) + '°');
+            setText(EL.tempFlow, t02.toFixed(1) + '°');
+            setText(EL.tempIngåenden, t01.toFixed(1) + '°');
+            setText(EL.tempTank, t08.toFixed(1) + '°');
+            setText(EL.tempComp, (parseFloat(data.T12) || 0).toFixed(1) + '°');
+            setText(EL.tempEvap, t03.toFixed(1) + '°');
+
+            // Driftdata - interpolate target from curve points
+            setText(EL.calcTarget, curveTarget(data, t04).toFixed(1) + '°C');
+
+            // COP
+            const copData = calculateCOP(data);
+            setText(EL.copValue, copData.cop > 0 ? copData.cop.toFixed(2) : '--');
+            setText(EL.powerIn, copData.powerIn.toFixed(2));
+            setText(EL.powerOut, copData.heatPower > 0 ? copData.heatPower.toFixed(1) : '--');
+            setText(EL.deltaT, copData.deltaT.toFixed(1));
+            setText(EL.compFreq, t33.toFixed(0));
+
+            // Pump active status
+            const pumpActive = t33 > 5 || powerKW > 0.2;
+            setText(EL.pumpActive, pumpActive ? 'AKTIV' : 'VILAR');
+            setClass(EL.pumpActive, 'stat-value' + (pumpActive ? '' : ' resting'));
+
+            // Pump status - detect if pump is stopped due to high tank temp (wood heating)
+            const statusTitle = EL.pumpStatusTitle;
+            const statusDesc = EL.pumpStatusDesc;
+
+            const compRunning = powerKW > 0.2 || t33 > 10;
+            const tankAboveTarget = t08 > heatTarget || t01 > heatTarget;
+            let pumpState;
+
+            if (!compRunning && tankAboveTarget) {
+                // Wood heating detected - tank temp above target
+                pumpState = 'wood';
+                setText(statusTitle, '🪵 Vedeldning detekterad');
+                setText(statusDesc, 'Tank: ' + t08.toFixed(1) + '°C > Börvärde: ' + heatTarget.toFixed(0) + '°C - Pumpen vilar');
+            } else if (compRunning) {
+                pumpState = 'running';
+                setText(statusTitle, '🟢 Värmepump aktiv');
+                setText(statusDesc, 'Kompressor: ' + t33.toFixed(0) + '% | Effekt: ' + powerKW.toFixed(2) + ' kW');
+            } else {
+                pumpState = 'stopped';
+                setText(statusTitle, '🔴 Värmepump stannad');
+                setText(statusDesc, 'Kompressorn är av');
+            }
 
-        function safeToggleSilent() {
-            if (!passwordVerified && !verifyPassword()) return;
-            setParam('hanControl', silentMode ? '0000000000000000' : '0000000000000010');
-        }
+            // Mode badge
+            const modeBadge = EL.modeBadge;
+            const mode = data.Mode;
+            setText(modeBadge, mode === '1' ? 'VÄRME' : mode === '2' ? 'KYLA' : mode === '3' ? 'VV' : 'LÄGE ' + mode);
+            setClass(modeBadge, 'badge ' + (mode === '1' ? 'heating' : mode === '3' ? 'hotwater' : 'idle'));
 
-        function safeTogglePower() {
-            if (!passwordVerified && !verifyPassword()) return;
-            const newState = pumpPower ? '0' : '1';
-            if (!pumpPower || confirm('Är du säker på att du vill STÄNGA AV pumpen?')) {
-                setParam('Power', newState);
-            }
-        }
+            silentMode = data.hanControl && data.hanControl.includes('1');
 
-        async function setParam(code, value) {
-            try {
-                const res = await fetch('/api/control', {
-                    method: 'POST',
-                    headers: {'Content-Type': 'application/json'},
-                    body: JSON.stringify({code, value: String(value)})
-                });
-                const data = await res.json();
-                if (data.success) {
-                    showMessage('Sparat: ' + code + ' = ' + value);
-                    fetchStatus();
-                } else {
-                    showMessage('Fel', true);
-                }
-            } catch (e) {
-                showMessage('Anslutningsfel', true);
-            }
+            // One class write each; CSS shows the matching wood/compressor/silent badges
+            setClass(EL.pumpStatus, 'pump-status ' + pumpState);
+            setClass(document.body, 'pump-' + pumpState + (silentMode ? ' silent-on' : ''));
+
+            // Power state
+            pumpPower = data.Power === '1';
+
+            setText(EL.lastUpdate, new Date().toLocaleTimeString('sv-SE'));
         }
 
         function toggleSilent() {
@@ -2401,7 +2891,7 @@ HTML_TEMPLATE = """
         }
 
         function initEnergyChart() {
-            const ctx = document.getElementById('energyChart').getContext('2d');
+            const ctx = EL.energyChart.getContext('2d');
             energyChart = new Chart(ctx, {
                 type: 'bar',
                 data: {
@@ -2415,7 +2905,11 @@ HTML_TEMPLATE = """
                 },
                 options: {
                     responsive: true,
+                    resizeDelay: 150,
                     maintainAspectRatio: false,
+                    parsing: false,
+                    normalized: true,
+                    animation: { duration: 0 },
                     plugins: {
                         legend: { display: false }
                     },
@@ -2438,34 +2932,21 @@ HTML_TEMPLATE = """
         }
 
         async function loadEnergy() {
+            if (!energyChart) return;  // Not scrolled into view yet
             try {
                 const res = await fetch('/api/energy?hours=72');
                 const data = await res.json();
 
                 // Update stats
-                document.getElementById('energyToday').textContent = (data.today_kwh || 0).toFixed(1);
-                document.getElementById('energy24h').textContent = (data.last_24h_kwh || 0).toFixed(1);
-                document.getElementById('energy7d').textContent = (data.total_kwh || 0).toFixed(1);
-                document.getElementById('energyTotal').textContent = (data.total_kwh || 0).toFixed(1);
-
-                if (data.readings && data.readings.length > 0) {
-                    // Aggregate by day
-                    const dailyData = {};
-                    data.readings.forEach(r => {
-                        const day = r.timestamp.split('T')[0];
-                        if (!dailyData[day]) dailyData[day] = 0;
-                        dailyData[day] += r.kwh;
-                    });
-
-                    const chartData = Object.entries(dailyData)
-                        .map(([day, kwh]) => ({
-                            x: new Date(day),
-                            y: parseFloat(kwh.toFixed(2))
-                        }))
-                        .sort((a, b) => a.x - b.x);
-
-                    energyChart.data.datasets[0].data = chartData;
-                    energyChart.update();
+                setText(EL.energyToday, (data.today_kwh || 0).toFixed(1));
+                setText(EL.energy24h, (data.last_24h_kwh || 0).toFixed(1));
+                setText(EL.energy7d, (data.total_kwh || 0).toFixed(1));
+                setText(EL.energyTotal, (data.total_kwh || 0).toFixed(1));
+
+                if (data.daily && data.daily.length > 0) {
+                    // Days arrive summed and sorted by the server
+                    energyChart.data.datasets[0].data = data.daily.map(row => ({x: Date.parse(row.day), y: row.kwh}));
+                    energyChart.update('none');
                 }
             } catch (e) {
                 console.error('Energy fetch error:', e);
@@ -2490,41 +2971,373 @@ HTML_TEMPLATE = """
             setTimeout(() => { btn.textContent = 'Importera 72h historik'; btn.disabled = false; }, 3000);
         }
 
-        // Load wood heating stats from local database (7 days)
+        function renderWood(data) {
+            setText(EL.woodHours, data.total_hours || 0);
+            setText(EL.woodSessions, data.sessions || 0);
+        }
+
+        // Load wood heating stats from local database (7 days); the status
+        // stream keeps them current, this is for right after an import
         async function loadWoodStats() {
             try {
                 const res = await fetch('/api/wood-heating?hours=168');
                 const data = await res.json();
-                if (data) {
-                    document.getElementById('woodHours').textContent = data.total_hours || 0;
-                    document.getElementById('woodSessions').textContent = data.sessions || 0;
-                }
+                if (data) renderWood(data);
             } catch (e) {
                 console.error('Wood stats error:', e);
             }
         }
 
-        // Initialize
-        initChart();
-        initEnergyChart();
-        fetchStatus();
-        loadHistory();
-        loadEnergy();
-        loadWoodStats();
-        setInterval(fetchStatus, 10000);
-        setInterval(loadHistory, 60000); // Refresh history every minute
-        setInterval(loadEnergy, 300000); // Refresh energy every 5 minutes
-        setInterval(loadWoodStats, 300000); // Refresh wood stats every 5 minutes
-    </script>
+        // Initialize; Chart.js is deferred and has run by DOMContentLoaded
+        connectStream();
+        document.addEventListener('DOMContentLoaded', () => {
+            initChart();
+            loadHistory(true);
+            // The energy card sits below the fold on phones; build its chart
+            // and fetch its data only once it scrolls into view
+            new IntersectionObserver((entries, observer) => {
+                if (!entries.some(e => e.isIntersecting)) return;
+                observer.disconnect();
+                initEnergyChart();
+                loadEnergy();
+            }).observe(EL.energyChart);
+        });
+
+        // Poll only while the tab is visible; refresh history at once on return.
+        // Live status comes from the stream, which reconnects by itself
+        // (or from connectStream's fallback polling when the server refuses it).
+        const POLLERS = [
+            [loadHistory, 60000],     // Refresh history every minute
+            [loadEnergy, 300000]      // Refresh energy every 5 minutes
+        ];
+        let pollTimers = [];
+
+        function schedulePolling() {
+            pollTimers.forEach(clearInterval);
+            pollTimers = document.visibilityState === 'visible'
+                ? POLLERS.map(([fn, ms]) => setInterval(fn, ms))
+                : [];
+        }
+
+        document.addEventListener('visibilitychange', () => {
+            schedulePolling();
+            connectStream();
+            if (document.visibilityState === 'visible') loadHistory();
+        });
+        schedulePolling();
+"""
+
+HTML_TEMPLATE = """
+<!DOCTYPE html>
+<html lang="sv">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Perifal LV-418 Dashboard</title>
+    <link rel="preconnect" href="https://cdn.jsdelivr.net" crossorigin>
+    <script defer src="https://cdn.jsdelivr.net/npm/chart.js@4.4.0/dist/chart.umd.js" crossorigin="anonymous"></script>
+    <script defer src="https://cdn.jsdelivr.net/npm/chartjs-adapter-date-fns@3.0.0/dist/chartjs-adapter-date-fns.bundle.min.js" crossorigin="anonymous"></script>
+    <link rel="stylesheet" href="/assets/base.css">
+    <link rel="stylesheet" href="/assets/dashboard.css">
+</head>
+<body>
+    <div class="container">
+        <header>
+            <h1>🔥 Perifal LV-418</h1>
+            <div class="badges">
+                <span id="statusBadge" class="badge online">ONLINE</span>
+                <span id="modeBadge" class="badge heating">VÄRME</span>
+                <span id="compBadge" class="badge compressor">KOMPRESSOR</span>
+                <span id="woodBadge" class="badge wood">VEDELDNING</span>
+                <span id="silentBadge" class="badge silent">TYST</span>
+                <a href="/settings" target="_blank" class="badge" style="background:#7c4dff;text-decoration:none;cursor:pointer">INSTÄLLNINGAR</a>
+                <a href="/logout" class="badge" style="background:#546e7a;text-decoration:none;cursor:pointer">LOGGA UT</a>
+            </div>
+        </header>
+
+        <!-- Pump status indicator -->
+        <div id="pumpStatus" class="pump-status running">
+            <h3 id="pumpStatusTitle">🟢 Värmepump aktiv</h3>
+            <p id="pumpStatusDesc">Kompressorn körs</p>
+        </div>
+
+        <div class="grid">
+            <!-- COP Card -->
+            <div class="card">
+                <h2>⚡ Effektivitet</h2>
+                <div class="cop-display">
+                    <div class="cop-value" id="copValue">--</div>
+                    <div class="cop-label">COP (Coefficient of Performance)</div>
+                </div>
+                <div class="cop-details">
+                    <div class="cop-detail">
+                        <div class="cop-detail-value" id="powerIn">--</div>
+                        <div class="cop-detail-label">El in (kW)</div>
+                    </div>
+                    <div class="cop-detail">
+                        <div class="cop-detail-value" id="powerOut">--</div>
+                        <div class="cop-detail-label">Värme ut (kW)</div>
+                    </div>
+                    <div class="cop-detail">
+                        <div class="cop-detail-value" id="deltaT">--</div>
+                        <div class="cop-detail-label">ΔT (°C)</div>
+                    </div>
+                    <div class="cop-detail">
+                        <div class="cop-detail-value" id="compFreq">--</div>
+                        <div class="cop-detail-label">Kompressor %</div>
+                    </div>
+                </div>
+            </div>
+
+            <!-- Temperatures & Stats -->
+            <div class="card">
+                <h2>🌡️ Temperaturer & Driftdata</h2>
+                <div class="temps">
+                    <div class="temp-item temp-outdoor">
+                        <div class="temp-value" id="tempOutdoor">--</div>
+                        <div class="temp-label">Utomhus</div>
+                    </div>
+                    <div class="temp-item temp-flow">
+                        <div class="temp-value" id="tempFlow">--</div>
+                        <div class="temp-label">Utgående</div>
+                    </div>
+                    <div class="temp-item temp-return">
+                        <div class="temp-value" id="tempIngåenden">--</div>
+                        <div class="temp-label">Ingående</div>
+                    </div>
+                    <div class="temp-item temp-tank">
+                        <div class="temp-value" id="tempTank">--</div>
+                        <div class="temp-label">Ackumulatortank</div>
+                    </div>
+                    <div class="temp-item temp-comp">
+                        <div class="temp-value" id="tempComp">--</div>
+                        <div class="temp-label">Kompressor</div>
+                    </div>
+                    <div class="temp-item temp-evap">
+                        <div class="temp-value" id="tempEvap">--</div>
+                        <div class="temp-label">Förångare</div>
+                    </div>
+                </div>
+                <div class="stats" style="grid-template-columns: repeat(2, 1fr); margin-top: 15px;">
+                    <div class="stat-item">
+                        <div class="stat-value" id="pumpActive">--</div>
+                        <div class="stat-label">Pump</div>
+                    </div>
+                    <div class="stat-item">
+                        <div class="stat-value" id="calcTarget">--</div>
+                        <div class="stat-label">Börvärde</div>
+                    </div>
+                </div>
+                <div class="stats" style="grid-template-columns: 1fr; margin-top: 10px;">
+                    <div class="stat-item" style="background: rgba(141, 110, 99, 0.3);">
+                        <div class="stat-value" style="color:#8d6e63;"><span id="woodHours">--</span> / <span id="woodSessions">--</span></div>
+                        <div class="stat-label">🪵 Eldning senaste 7 dygn (timmar / tillfällen)</div>
+                        <button id="importBtn" onclick="importHistory()" style="margin-top:8px; padding:4px 12px; font-size:11px; background:#444; color:#aaa; border:1px solid #555; border-radius:4px; cursor:pointer;">Importera 72h historik</button>
+                    </div>
+                </div>
+            </div>
+
+        </div>
+
+        <!-- Historical Chart -->
+        <div class="card">
+            <h2>📈 Historik</h2>
+            <div class="chart-controls">
+                <label>Visa:</label>
+                <select id="historyRange" onchange="loadHistory(true)">
+                    <option value="1">Senaste timmen</option>
+                    <option value="6">6 timmar</option>
+                    <option value="24" selected>24 timmar</option>
+                    <option value="72">3 dagar</option>
+                    <option value="168">7 dagar</option>
+                    <option value="custom">Anpassat...</option>
+                </select>
+                <div id="customDateRange" style="display:none;">
+                    <input type="date" id="dateFrom">
+                    <span>till</span>
+                    <input type="date" id="dateTo">
+                    <button onclick="loadHistory(true)">Hämta</button>
+                </div>
+                <label style="margin-left:15px;">Visa:</label>
+                <select id="chartDataset" onchange="updateChartVisibility()">
+                    <option value="all">Alla</option>
+                    <option value="temps">Temperaturer</option>
+                    <option value="cop">COP & Effekt</option>
+                </select>
+            </div>
+            <div class="chart-container">
+                <canvas id="historyChart"></canvas>
+            </div>
+        </div>
+
+        <!-- Energy Statistics -->
+        <div class="card">
+            <h2>⚡ Elförbrukning</h2>
+            <div class="stats" style="grid-template-columns: repeat(4, 1fr);">
+                <div class="stat-item">
+                    <div class="stat-value" id="energyToday">--</div>
+                    <div class="stat-label">Idag (kWh)</div>
+                </div>
+                <div class="stat-item">
+                    <div class="stat-value" id="energy24h">--</div>
+                    <div class="stat-label">24h (kWh)</div>
+                </div>
+                <div class="stat-item">
+                    <div class="stat-value" id="energy7d">--</div>
+                    <div class="stat-label">7 dagar (kWh)</div>
+                </div>
+                <div class="stat-item">
+                    <div class="stat-value" id="energyTotal">--</div>
+                    <div class="stat-label">Totalt (kWh)</div>
+                </div>
+            </div>
+            <div class="chart-container" style="height:200px;margin-top:15px;">
+                <canvas id="energyChart"></canvas>
+            </div>
+        </div>
+
+        <div class="update-info">
+            Live-data var 10s | Historik från molnet | Senast: <span id="lastUpdate">--</span>
+            <br><span id="dbStatus" style="color:#666">Moln: kontrollerar...</span>
+        </div>
+    </div>
+
+    <div id="message" class="message"></div>
+
+    <script src="/assets/common.js"></script>
+    <script src="/assets/dashboard.js"></script>
 </body>
 </html>
 """
 
+# ============== Static Pages ==============
+
+@dataclass(frozen=True)
+class StaticFile:
+    """A page or asset encoded once at import, with its content hash"""
+    raw: bytes
+    gz: bytes
+    br: bytes
+    etag: str
+    mimetype: str
+
+def _encode_static(text, mimetype='text/html'):
+    raw = text.encode('utf-8')
+    etag = hashlib.blake2b(raw, digest_size=8).hexdigest()
+    # Maximum quality is slow, but it is paid once at import
+    return StaticFile(raw, gzip.compress(raw, 9), brotli.compress(raw, quality=11), etag, mimetype)
+
+# Assets are served under content-hashed names so they can be cached for good.
+# Pages refer to them by plain name (/assets/base.css); _link_assets() rewrites.
+ASSETS = {}
+ASSET_URLS = {}
+
+def _register_asset(name, text, mimetype):
+    item = _encode_static(text, mimetype)
+    stem, ext = name.rsplit('.', 1)
+    hashed = f'{stem}.{item.etag}.{ext}'
+    ASSETS[hashed] = item
+    ASSET_URLS[f'/assets/{name}'] = f'/assets/{hashed}'
+
+def _link_assets(html):
+    for plain, hashed in ASSET_URLS.items():
+        html = html.replace(f'"{plain}"', f'"{hashed}"')
+    return html
+
+_register_asset('base.css', rcssmin.cssmin(BASE_STYLE), 'text/css')
+_register_asset('settings.css', rcssmin.cssmin(SETTINGS_STYLE), 'text/css')
+_register_asset('dashboard.css', rcssmin.cssmin(DASHBOARD_STYLE), 'text/css')
+_register_asset('common.js', rjsmin.jsmin(COMMON_SCRIPT), 'text/javascript')
+_register_asset('dashboard.js', rjsmin.jsmin(DASHBOARD_SCRIPT), 'text/javascript')
+
+SETTINGS_PAGE = _encode_static(_link_assets(minify_html(SETTINGS_TEMPLATE)))
+# Link to the settings page by content hash so browsers may cache it for good
+HTML_PAGE = _encode_static(_link_assets(minify_html(HTML_TEMPLATE)).replace(
+    'href="/settings"', f'href="/settings?v={SETTINGS_PAGE.etag}"', 1))
+# Without an error or success message the auth pages are static too
+LOGIN_PAGE = _encode_static(LOGIN_TMPL.render())
+REGISTER_PAGE = _encode_static(REGISTER_TMPL.render())
+
+def encoded_response(item, cache_control):
+    """Serve precomputed bytes (brotli, else gzip, else plain), 304 on a matching ETag"""
+    accepted = request.accept_encodings
+    if accepted['br']:
+        body, encoding, etag = item.br, 'br', item.etag + '-br'
+    elif accepted['gzip']:
+        body, encoding, etag = item.gz, 'gzip', item.etag + '-gz'
+    else:
+        body, encoding, etag = item.raw, None, item.etag
+    if etag in request.if_none_match:
+        resp = Response(status=304)
+    else:
+        resp = Response(body, mimetype=item.mimetype)
+        if encoding:
+            resp.headers['Content-Encoding'] = encoding
+    resp.set_etag(etag)
+    resp.headers['Vary'] = 'Accept-Encoding'
+    resp.headers['Cache-Control'] = cache_control
+    return resp
+
+def page_response(page):
+    """Serve a static page.
+
+    A request carrying the page's current hash as ?v= is cached as immutable;
+    plain URLs revalidate against the ETag and usually get a bodiless 304.
+    Most pages sit behind login, so all are kept out of shared caches.
+    """
+    if request.args.get('v') == page.etag:
+        return encoded_response(page, 'private, max-age=31536000, immutable')
+    return encoded_response(page, 'private, no-cache')
+
+def json_response(obj):
+    """JSON response encoded with orjson (datetimes serialize natively as ISO 8601)"""
+    return Response(orjson.dumps(obj), mimetype='application/json')
+
+def etag_cached(f):
+    """Decorator: tag the view's response with a content hash and answer a
+    matching If-None-Match with a bodiless 304, so pollers skip the download"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        resp = f(*args, **kwargs)
+        if resp.is_streamed:
+            return resp
+        etag = hashlib.blake2b(resp.get_data(), digest_size=8).hexdigest()
+        if etag in request.if_none_match:
+            resp = Response(status=304)
+        resp.set_etag(etag)
+        resp.headers['Cache-Control'] = 'private, no-cache'
+        return resp
+    return decorated_function
+
 def get_client():
-    client = PerifalClient(USERNAME, PASSWORD)
-    client.login()
+    """The shared logged-in client for request handlers; raises if login fails"""
+    client = get_shared_client()
+    if client is None:
+        raise RuntimeError("Cloud login failed")
     return client
 
+# Cloud history is hourly; one fetch per series and range serves every request for a minute
+CLOUD_HISTORY_CACHE_SECONDS = 55
+CLOUD_HISTORY_CACHE_MAX = 512
+_cloud_history_cache = {}  # (address, start, end, frequency) -> (expires, data)
+_cloud_history_lock = threading.Lock()
+
+def get_cloud_history(client, address, start_time, end_time, frequency):
+    """client.get_history() for DEVICE_CODE; only successful answers are cached"""
+    key = (address, start_time, end_time, frequency)
+    now = time.monotonic()
+    with _cloud_history_lock:
+        entry = _cloud_history_cache.get(key)
+    if entry and entry[0] > now:
+        return entry[1]
+    data = client.get_history(DEVICE_CODE, address, start_time, end_time, frequency)
+    if isinstance(data, dict):
+        with _cloud_history_lock:
+            if len(_cloud_history_cache) >= CLOUD_HISTORY_CACHE_MAX:
+                _cloud_history_cache.clear()
+            _cloud_history_cache[key] = (now + CLOUD_HISTORY_CACHE_SECONDS, data)
+    return data
+
 # ============== Auth Routes ==============
 
 @app.route('/login', methods=['GET', 'POST'])
@@ -2533,18 +3346,18 @@ def login():
         email = request.form.get('email', '').strip()
         password = request.form.get('password', '')
 
-        user = get_user_by_email(email)
+        user = get_user_for_login(email) if EMAIL_RE.match(email) else None
         if not user:
-            return render_template_string(LOGIN_TEMPLATE, error="Felaktig e-post eller lösenord")
+            return render_template(LOGIN_TMPL, error="Felaktig e-post eller lösenord")
 
         if not verify_password(password, user['password_hash']):
-            return render_template_string(LOGIN_TEMPLATE, error="Felaktig e-post eller lösenord")
+            return render_template(LOGIN_TMPL, error="Felaktig e-post eller lösenord")
 
         if not user['email_verified']:
-            return render_template_string(LOGIN_TEMPLATE, error="Du behöver verifiera din e-postadress först")
+            return render_template(LOGIN_TMPL, error="Du behöver verifiera din e-postadress först")
 
         if not user['admin_approved']:
-            return render_template_string(LOGIN_TEMPLATE, error="Ditt konto väntar på admin-godkännande")
+            return render_template(LOGIN_TMPL, error="Ditt konto väntar på admin-godkännande")
 
         # Login successful
         session['user_id'] = user['id']
@@ -2553,7 +3366,7 @@ def login():
         session['is_admin'] = bool(user['is_admin'])
         return redirect(url_for('index'))
 
-    return render_template_string(LOGIN_TEMPLATE)
+    return page_response(LOGIN_PAGE)
 
 @app.route('/register', methods=['GET', 'POST'])
 def register():
@@ -2563,25 +3376,25 @@ def register():
         password = request.form.get('password', '')
 
         if not name or not email or not password:
-            return render_template_string(REGISTER_TEMPLATE, error="Alla fält måste fyllas i")
+            return render_template(REGISTER_TMPL, error="Alla fält måste fyllas i")
 
         if len(password) < 6:
-            return render_template_string(REGISTER_TEMPLATE, error="Lösenordet måste vara minst 6 tecken")
+            return render_template(REGISTER_TMPL, error="Lösenordet måste vara minst 6 tecken")
 
         # Check if user exists
         existing = get_user_by_email(email)
         if existing:
-            return render_template_string(REGISTER_TEMPLATE, error="E-postadressen är redan registrerad")
+            return render_template(REGISTER_TMPL, error="E-postadressen är redan registrerad")
 
         # Create user
         user_id = create_user(email, password, name)
         if user_id:
-            return render_template_string(REGISTER_TEMPLATE,
+            return render_template(REGISTER_TMPL,
                 success="Konto skapat! Kolla din e-post för verifieringslänk.")
         else:
-            return render_template_string(REGISTER_TEMPLATE, error="Kunde inte skapa konto, försök igen")
+            return render_template(REGISTER_TMPL, error="Kunde inte skapa konto, försök igen")
 
-    return render_template_string(REGISTER_TEMPLATE)
+    return page_response(REGISTER_PAGE)
 
 @app.route('/logout')
 def logout():
@@ -2590,80 +3403,77 @@ def logout():
 
 @app.route('/verify/<token>')
 def verify_email(token):
+    conn = None
     try:
         conn = get_db_connection()
         cur = conn.cursor()
 
+        # One statement: finds and consumes the token, so a link can't be used twice
         if USE_POSTGRES:
-            cur.execute('SELECT id, email FROM users WHERE verification_token = %s', (token,))
+            cur.execute('UPDATE users SET email_verified = TRUE, verification_token = NULL '
+                        'WHERE verification_token = %s RETURNING id', (token,))
         else:
-            cur.execute('SELECT id, email FROM users WHERE verification_token = ?', (token,))
+            cur.execute('UPDATE users SET email_verified = 1, verification_token = NULL '
+                        'WHERE verification_token = ? RETURNING id', (token,))
 
         row = cur.fetchone()
         if not row:
-            conn.close()
-            return render_template_string(MESSAGE_TEMPLATE,
+            return render_template(MESSAGE_TMPL,
                 title="Ogiltig länk", message="Verifieringslänken är ogiltig eller har redan använts.",
                 msg_class="error")
 
-        if USE_POSTGRES:
-            cur.execute('UPDATE users SET email_verified = TRUE, verification_token = NULL WHERE id = %s', (row[0],))
-        else:
-            cur.execute('UPDATE users SET email_verified = 1, verification_token = NULL WHERE id = ?', (row[0],))
-
         conn.commit()
-        conn.close()
+        invalidate_user_cache()
 
-        return render_template_string(MESSAGE_TEMPLATE,
+        return render_template(MESSAGE_TMPL,
             title="E-post verifierad!", message="Din e-postadress är nu verifierad. En administratör kommer granska och godkänna ditt konto.",
             msg_class="success")
     except Exception as e:
         print(f"Verify error: {e}", flush=True)
-        return render_template_string(MESSAGE_TEMPLATE,
+        return render_template(MESSAGE_TMPL,
             title="Fel", message="Ett fel uppstod vid verifiering.",
             msg_class="error")
+    finally:
+        release_db_connection(conn)
 
 @app.route('/admin/approve/<int:user_id>')
 def admin_approve(user_id):
     try:
         conn = get_db_connection()
-        cur = conn.cursor()
+        try:
+            cur = conn.cursor()
 
-        if USE_POSTGRES:
-            cur.execute('SELECT email, name, email_verified FROM users WHERE id = %s', (user_id,))
-        else:
-            cur.execute('SELECT email, name, email_verified FROM users WHERE id = ?', (user_id,))
+            if USE_POSTGRES:
+                cur.execute('UPDATE users SET admin_approved = TRUE WHERE id = %s RETURNING email, name', (user_id,))
+            else:
+                cur.execute('UPDATE users SET admin_approved = 1 WHERE id = ? RETURNING email, name', (user_id,))
 
-        row = cur.fetchone()
-        if not row:
-            conn.close()
-            return render_template_string(MESSAGE_TEMPLATE,
-                title="Användare finns inte", message="Användaren kunde inte hittas.",
-                msg_class="error")
+            row = cur.fetchone()
+            if not row:
+                return render_template(MESSAGE_TMPL,
+                    title="Användare finns inte", message="Användaren kunde inte hittas.",
+                    msg_class="error")
 
-        if USE_POSTGRES:
-            cur.execute('UPDATE users SET admin_approved = TRUE WHERE id = %s', (user_id,))
-        else:
-            cur.execute('UPDATE users SET admin_approved = 1 WHERE id = ?', (user_id,))
-
-        conn.commit()
-        conn.close()
+            conn.commit()
+            invalidate_user_cache()
+        finally:
+            release_db_connection(conn)
 
         email = row[0] if USE_POSTGRES else row['email']
         name = row[1] if USE_POSTGRES else row['name']
 
-        # Notify user
-        send_email(email, "Ditt konto har godkänts - Perifal LV-418",
+        # Notify user; queued so the admin isn't kept waiting on SMTP
+        EMAIL_POOL.submit(send_email, email, "Ditt konto har godkänts - Perifal LV-418",
             f"""<h2>Välkommen {name}!</h2>
             <p>Ditt konto har nu godkänts av en administratör.</p>
             <p><a href="{APP_URL}/login">Klicka här för att logga in</a></p>""")
 
-        return render_template_string(MESSAGE_TEMPLATE,
+        return render_template(MESSAGE_TMPL,
             title="Användare godkänd", message=f"{name} ({email}) har nu godkänts och kan logga in.",
             msg_class="success")
     except Exception as e:
         print(f"Approve error: {e}", flush=True)
-        return render_template_string(MESSAGE_TEMPLATE,
+        return render_template(MESSAGE_TMPL,
             title="Fel", message="Ett fel uppstod vid godkännande.",
             msg_class="error")
 
@@ -2672,27 +3482,47 @@ def admin_approve(user_id):
 def api_import_cloud():
     """Import cloud history to database (admin only)"""
     imported = import_cloud_history()
-    return jsonify({'imported': imported})
+    return json_response({'imported': imported})
 
 # ============== End Auth Routes ==============
 
 @app.route('/')
 @login_required
 def index():
-    return render_template_string(HTML_TEMPLATE)
+    return page_response(HTML_PAGE)
 
 @app.route('/settings')
 @login_required
 def settings():
-    return render_template_string(SETTINGS_TEMPLATE)
+    return page_response(SETTINGS_PAGE)
+
+@app.route('/assets/<name>')
+def asset(name):
+    item = ASSETS.get(name)
+    if item is None:
+        abort(404)
+    return encoded_response(item, 'public, max-age=31536000, immutable')
 
 @app.route('/api/status')
 def api_status():
     # Always use cloud API for live status (polled every 10 sec by frontend)
     # Database is only for historical data
-    client = get_client()
-    params = client.get_all_parameters(DEVICE_CODE, ALL_PARAMS)
-    return jsonify(params)
+    return Response(cached_status_body(), mimetype='application/json',
+                    headers={'Cache-Control': f'private, max-age={STATUS_CACHE_SECONDS}'})
+
+@app.route('/api/status/stream')
+@login_required
+def api_status_stream():
+    with_wood = request.args.get('wood') == '1'
+    if not open_status_stream():
+        # EventSource gives up on a 503; the page falls back to polling /api/status
+        return Response('Too many live streams', status=503, mimetype='text/plain',
+                        headers={'Retry-After': str(STREAM_MAX_SECONDS)})
+    response = Response(status_events(with_wood), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-store', 'X-Accel-Buffering': 'no'})
+    # Runs when the server closes the response, even if the stream never started
+    response.call_on_close(close_status_stream)
+    return response
 
 @app.route('/api/wood-heating')
 def api_wood_heating():
@@ -2700,25 +3530,71 @@ def api_wood_heating():
     hours = request.args.get('hours', 168, type=int)  # Default 7 days
     target = request.args.get('target', type=float)  # Optional target override
     threshold = request.args.get('threshold', 5, type=float)  # Degrees above target
-    result = detect_wood_heating(hours=hours, target_override=target, threshold_temp=threshold)
-    return jsonify(result)
+    try:
+        return json_response(_cached_wood_heating(hours, target, threshold, int(time.time() // 60)))
+    except Exception as e:
+        return json_response({'total_hours': 0, 'sessions': 0, 'periods': [], 'error': str(e)})
+
+def history_response(readings, max_points, meta):
+    """History JSON: raw readings, or downsampled chart series when max_points is set"""
+    if max_points:
+        meta['series'] = downsample_history(readings, max_points)
+        meta['count'] = len(readings)
+    else:
+        meta['readings'] = readings
+    return json_response(meta)
 
 @app.route('/api/history')
+@etag_cached
 def api_history():
     """Fetch history from local database, fallback to cloud API"""
     hours = request.args.get('hours', 24, type=int)
     source = request.args.get('source', 'auto')  # auto, db, cloud
+    # Sent by the chart: about two points per canvas pixel is all it can show
+    max_points = request.args.get('max_points', type=int)
+    if max_points:
+        max_points = min(max(max_points, 3), MAX_HISTORY_POINTS)
 
     # Try readings table first (has pre-calculated COP from live logger)
     if source != 'cloud':
-        db_readings = get_local_history(hours)
-        if db_readings and len(db_readings) > 3:
-            return jsonify({
-                'readings': db_readings,
-                'source': 'database',
-                'hours_requested': hours,
-                'count': len(db_readings)
-            })
+        if request.args.get('format') == 'ndjson':
+            # Rows go out as they are read; nothing holds the whole range in memory.
+            # The first batch is read here: without rows, fall back like the JSON path
+            stream = iter_local_history_ndjson(hours)
+            first = next(stream, None)
+            if first is not None:
+                response = Response(chain((first,), stream), mimetype='application/x-ndjson')
+                # Releases the database connection even if the client goes away early
+                response.call_on_close(stream.close)
+                return response
+
+        # The 7-day view barely moves in a minute; let it be up to 5 minutes old
+        bucket = int(time.time() // (300 if hours >= 168 else 60))
+        # A database error falls through to the fallbacks below, like an empty table
+        if max_points:
+            try:
+                count, series = _cached_history_series(hours, max_points, bucket)
+            except Exception as e:
+                print(f"Error getting local history: {e}", flush=True)
+                count = 0
+            if count > 3:
+                return json_response({
+                    'series': series,
+                    'source': 'database',
+                    'hours_requested': hours,
+                    'count': count
+                })
+        else:
+            try:
+                count, readings_json = _cached_local_history(hours, bucket)
+            except Exception:
+                count = 0
+            if count > 3:
+                # Rows are already serialized by the database; only wrap them
+                return Response(
+                    f'{{"readings": {readings_json}, "source": "database", '
+                    f'"hours_requested": {hours}, "count": {count}}}',
+                    mimetype='application/json')
 
         # Fallback to readings_raw with estimated COP (2 m³/h flow)
         params = ['T01', 'T02', 'T04', 'T08', '2054']
@@ -2732,12 +3608,10 @@ def api_history():
 
                 # Calculate COP with estimated flow (2 m³/h for LV-418)
                 cop = None
-                if t01 is not None and t02 is not None and power_kw is not None and power_kw > 0.1:
-                    delta_t = t02 - t01
-                    flow_lmin = 2.0 * 1000 / 60  # 2 m³/h estimated
-                    heat_power = (flow_lmin * delta_t * 4.186) / 60
-                    if heat_power > 0:
-                        cop = min(heat_power / power_kw, 5.0)
+                if t01 is not None and t02 is not None and power_kw is not None:
+                    heat_power, cop = calculate_cop(t01, t02, ESTIMATED_FLOW_M3H, power_kw)
+                    if heat_power <= 0:
+                        cop = None
 
                 readings.append({
                     'timestamp': r['timestamp'],
@@ -2749,8 +3623,7 @@ def api_history():
                     't39_power_kw': power_kw
                 })
 
-            return jsonify({
-                'readings': readings,
+            return history_response(readings, max_points, {
                 'source': 'database_raw',
                 'hours_requested': hours,
                 'count': len(readings),
@@ -2768,8 +3641,10 @@ def api_history():
             start_time = date_from + " 00:00:00"
             end_time = date_to + " 23:59:59"
         else:
-            end_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            start_time = (datetime.now() - timedelta(hours=hours)).strftime('%Y-%m-%d %H:%M:%S')
+            # Whole minutes, so requests within the same minute share cached series
+            now = datetime.now().replace(second=0, microsecond=0)
+            end_time = now.strftime('%Y-%m-%d %H:%M:%S')
+            start_time = (now - timedelta(hours=hours)).strftime('%Y-%m-%d %H:%M:%S')
 
         # Determine frequency based on time range
         # Note: "week" and "month" don't work well with Warmlink API, use "day" for up to 7 days
@@ -2778,60 +3653,59 @@ def api_history():
         else:
             frequency = "month"
 
-        # Fetch all data series from cloud
-        flow_data = client.get_history(DEVICE_CODE, "2046", start_time, end_time, frequency)  # T02
-        tank_data = client.get_history(DEVICE_CODE, "2047", start_time, end_time, frequency)  # T08
-        outdoor_data = client.get_history(DEVICE_CODE, "2048", start_time, end_time, frequency)  # T04
-        power_data = client.get_history(DEVICE_CODE, "2054", start_time, end_time, frequency)  # Power
-        return_data = client.get_history(DEVICE_CODE, "2049", start_time, end_time, frequency)  # T01
+        # Fetch all data series from cloud; each is a separate round trip, so run them concurrently
+        # T02, T08, T04, Power, T01
+        flow_data, tank_data, outdoor_data, power_data, return_data = HISTORY_POOL.map(
+            lambda address: get_cloud_history(client, address, start_time, end_time, frequency),
+            ("2046", "2047", "2048", "2054", "2049"))
 
         readings = []
 
-        flow_values = flow_data.get('valueList', []) if isinstance(flow_data, dict) else []
-        tank_values = tank_data.get('valueList', []) if isinstance(tank_data, dict) else []
-        outdoor_values = outdoor_data.get('valueList', []) if isinstance(outdoor_data, dict) else []
-        power_values = power_data.get('valueList', []) if isinstance(power_data, dict) else []
-        return_values = return_data.get('valueList', []) if isinstance(return_data, dict) else []
-
-        flow_by_time = {v['dateTime']: float(v['addressValue']) for v in flow_values}
-        tank_by_time = {v['dateTime']: float(v['addressValue']) for v in tank_values}
-        outdoor_by_time = {v['dateTime']: float(v['addressValue']) for v in outdoor_values}
-        power_by_time = {v['dateTime']: float(v['addressValue']) for v in power_values}
-        return_by_time = {v['dateTime']: float(v['addressValue']) for v in return_values}
-
-        all_times = set(flow_by_time.keys()) | set(tank_by_time.keys()) | set(outdoor_by_time.keys()) | set(power_by_time.keys()) | set(return_by_time.keys())
+        value_lists = [data.get('valueList', []) if isinstance(data, dict) else []
+                       for data in (flow_data, tank_data, outdoor_data, power_data, return_data)]
+
+        # The series normally share the same hourly timestamps; then one pass over
+        # the lists side by side is enough. Otherwise merge them on timestamp.
+        rows = None
+        if all(len(values) == len(value_lists[0]) for values in value_lists):
+            rows = []
+            for points in zip(*value_lists):
+                dt = points[0]['dateTime']
+                if any(point['dateTime'] != dt for point in points):
+                    rows = None
+                    break
+                rows.append((dt, *(float(point['addressValue']) for point in points)))
+            else:
+                rows.sort(key=lambda row: row[0])  # already sorted, so linear
+        if rows is None:
+            by_time = [{v['dateTime']: float(v['addressValue']) for v in values} for values in value_lists]
+            rows = [(dt, *(series.get(dt) for series in by_time)) for dt in sorted(set().union(*by_time))]
 
-        for dt in sorted(all_times):
+        # t02 = Utgående temp, t01 = Ingående temp
+        for dt, t02, t06, t04, power_kw, t01 in rows:
             try:
-                timestamp = datetime.strptime(dt, '%Y-%m-%d %H')
+                timestamp = parse_cloud_hour(dt)
             except:
                 continue
 
-            t02 = flow_by_time.get(dt)  # Utgående temp
-            t01 = return_by_time.get(dt)  # Ingående temp
-            power_kw = power_by_time.get(dt)
-
             # Calculate COP using estimated flow (2 m³/h) since cloud doesn't have T39
             cop = None
-            if t02 is not None and t01 is not None and power_kw is not None and power_kw > 0.1:
-                delta_t = t02 - t01
-                flow_lmin = 2.0 * 1000 / 60  # 2 m³/h estimated flow for LV-418
-                heat_power = (flow_lmin * delta_t * 4.186) / 60
-                if heat_power > 0:
-                    cop = min(heat_power / power_kw, 5.0)
+            if t02 is not None and t01 is not None and power_kw is not None:
+                heat_power, cop = calculate_cop(t01, t02, ESTIMATED_FLOW_M3H, power_kw)
+                if heat_power <= 0:
+                    cop = None
 
             readings.append({
                 'timestamp': timestamp.isoformat(),
                 't02_flow': t02,
-                't06': tank_by_time.get(dt),
-                't04_outdoor': outdoor_by_time.get(dt),
+                't06': t06,
+                't04_outdoor': t04,
                 't01_return': t01,
                 'cop_calculated': cop,
                 't39_power_kw': power_kw
             })
 
-        return jsonify({
-            'readings': readings,
+        return history_response(readings, max_points, {
             'source': 'cloud',
             'hours_requested': hours,
             'start_time': start_time,
@@ -2841,118 +3715,163 @@ def api_history():
 
     except Exception as e:
         import traceback
-        return jsonify({'readings': [], 'error': str(e), 'traceback': traceback.format_exc(), 'source': 'cloud'})
+        return json_response({'readings': [], 'error': str(e), 'traceback': traceback.format_exc(), 'source': 'cloud'})
 
-@app.route('/api/energy')
-def api_energy():
-    """Fetch energy consumption history from cloud"""
-    hours = request.args.get('hours', 168, type=int)  # Default 7 days
+@app.route('/api/history.bin')
+@etag_cached
+def api_history_bin():
+    """Local history as packed columns; about 30 bytes a row instead of ~180 as JSON"""
+    hours = request.args.get('hours', 24, type=int)
+    return Response(pack_history(get_local_history(hours)), mimetype='application/octet-stream',
+                    headers={'X-Columns': ','.join(HISTORY_BIN_COLUMNS)})
 
-    try:
-        client = get_client()
+# Hourly cloud figures; the dashboard polls every 5 minutes
+ENERGY_CACHE_SECONDS = 300
 
-        end_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        start_time = (datetime.now() - timedelta(hours=hours)).strftime('%Y-%m-%d %H:%M:%S')
+# Longer cloud time formats by string length; "YYYY-MM-DD HH" goes to parse_cloud_hour()
+CLOUD_TIME_FORMATS = {16: '%Y-%m-%d %H:%M', 19: '%Y-%m-%d %H:%M:%S'}
 
-        # Always use "day" frequency for consistent hourly data format
-        frequency = "day"
+def get_energy_summary(hours):
+    """Energy use over the last `hours` from the cloud, summed per day"""
+    client = get_client()
 
-        # 2054 = Power In (Total)
-        power_data = client.get_history(DEVICE_CODE, "2054", start_time, end_time, frequency)
+    end_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    start_time = (datetime.now() - timedelta(hours=hours)).strftime('%Y-%m-%d %H:%M:%S')
 
-        readings = []
-        total_kwh = 0
-        today_kwh = 0
-        last_24h_kwh = 0
-
-        today = datetime.now().strftime('%Y-%m-%d')
-        now = datetime.now()
-
-        if isinstance(power_data, dict):
-            values = power_data.get('valueList', [])
-            for v in values:
-                dt_str = v.get('dateTime', '')
-                kwh = float(v.get('addressValue', 0) or 0)
-                total_kwh += kwh
-
-                # Parse date - try multiple formats
-                dt = None
-                for fmt in ['%Y-%m-%d %H', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M']:
-                    try:
-                        dt = datetime.strptime(dt_str, fmt)
-                        break
-                    except:
-                        continue
+    # Always use "day" frequency for consistent hourly data format
+    frequency = "day"
 
-                if dt:
-                    readings.append({
-                        'timestamp': dt.isoformat(),
-                        'kwh': kwh
-                    })
-
-                    # Today's consumption
-                    if dt.date() == now.date():
-                        today_kwh += kwh
-
-                    # Last 24 hours
-                    if dt >= now - timedelta(hours=24):
-                        last_24h_kwh += kwh
-
-        return jsonify({
-            'readings': readings,
-            'total_kwh': round(total_kwh, 2),
-            'today_kwh': round(today_kwh, 2),
-            'last_24h_kwh': round(last_24h_kwh, 2),
-            'hours': hours,
-            'points': len(readings)
-        })
+    # 2054 = Power In (Total)
+    power_data = client.get_history(DEVICE_CODE, "2054", start_time, end_time, frequency)
+    # get_history() returns [] on failure; raise so the all-zero summary is not cached
+    if not isinstance(power_data, dict):
+        raise RuntimeError("No energy data from cloud API")
+
+    daily = {}
+    points = 0
+    total_kwh = 0
+    today_kwh = 0
+    last_24h_kwh = 0
+
+    now = datetime.now()
+    today = now.date()
+    cutoff_24h = now - timedelta(hours=24)
+
+    values = power_data.get('valueList', [])
+    for v in values:
+        dt_str = v.get('dateTime', '')
+        kwh = float(v.get('addressValue', 0) or 0)
+        total_kwh += kwh
 
+        # Parse date; the length tells the format, hourly is the usual one
+        fmt = CLOUD_TIME_FORMATS.get(len(dt_str))
+        try:
+            dt = datetime.strptime(dt_str, fmt) if fmt else parse_cloud_hour(dt_str)
+        except ValueError:
+            dt = None
+
+        if dt:
+            points += 1
+            date = dt.date()
+            day = date.isoformat()
+            daily[day] = daily.get(day, 0) + kwh
+
+            # Today's consumption
+            if date == today:
+                today_kwh += kwh
+
+            # Last 24 hours
+            if dt >= cutoff_24h:
+                last_24h_kwh += kwh
+
+    return {
+        'daily': [{'day': day, 'kwh': round(kwh, 2)} for day, kwh in sorted(daily.items())],
+        'total_kwh': round(total_kwh, 2),
+        'today_kwh': round(today_kwh, 2),
+        'last_24h_kwh': round(last_24h_kwh, 2),
+        'hours': hours,
+        'points': points
+    }
+
+@lru_cache(maxsize=4)
+def _cached_energy_summary(hours, bucket):
+    """get_energy_summary() memoized per ENERGY_CACHE_SECONDS bucket; errors are not cached"""
+    return get_energy_summary(hours)
+
+@app.route('/api/energy')
+@etag_cached
+def api_energy():
+    """Fetch energy consumption history from cloud"""
+    hours = request.args.get('hours', 168, type=int)  # Default 7 days
+
+    try:
+        return json_response(_cached_energy_summary(hours, int(time.time() // ENERGY_CACHE_SECONDS)))
     except Exception as e:
         import traceback
-        return jsonify({'readings': [], 'error': str(e), 'traceback': traceback.format_exc()})
+        return json_response({'daily': [], 'error': str(e), 'traceback': traceback.format_exc()})
+
+# Written by the standalone data_logger.py into the same SQLite file
+EVENT_COLUMNS = ('id', 'timestamp', 'event_type', 'description', 'value_before', 'value_after')
 
 @app.route('/api/events')
 def api_events():
     hours = request.args.get('hours', 24, type=int)
 
+    conn = None
     try:
-        conn = get_db()
-        conn.row_factory = sqlite3.Row
+        conn = get_db_connection()
         c = conn.cursor()
 
-        c.execute('''
-            SELECT * FROM events
-            WHERE timestamp > datetime('now', '-' || ? || ' hours')
+        # A plain string bound for the timestamp index; stored in UTC like CURRENT_TIMESTAMP
+        cutoff = (datetime.now(timezone.utc) - timedelta(hours=hours)).strftime('%Y-%m-%d %H:%M:%S')
+        c.execute(f'''
+            SELECT {', '.join(EVENT_COLUMNS)} FROM events
+            WHERE timestamp > {'%s' if USE_POSTGRES else '?'}
             ORDER BY timestamp DESC
             LIMIT 100
-        ''', (hours,))
+        ''', (cutoff,))
 
-        rows = c.fetchall()
-        conn.close()
-
-        return jsonify({'events': [dict(row) for row in rows]})
+        return json_response({'events': [dict(zip(EVENT_COLUMNS, row)) for row in c.fetchall()]})
 
     except Exception as e:
-        return jsonify({'events': [], 'error': str(e)})
+        return json_response({'events': [], 'error': str(e)})
+    finally:
+        release_db_connection(conn)
+
+@app.route('/api/unlock', methods=['POST'])
+@login_required
+def api_unlock():
+    """Unlock pump control for this session"""
+    password = request.form.get('password', '')
+    if not hmac.compare_digest(password.encode(), CONTROL_PASSWORD.encode()):
+        return json_response({'success': False, 'error': 'Wrong password'}), 403
+    session['control_until'] = time.time() + CONTROL_UNLOCK_SECONDS
+    return json_response({'success': True})
 
 @app.route('/api/control', methods=['POST'])
 def api_control():
-    data = request.json
+    if session.get('control_until', 0) < time.time():
+        return json_response({'success': False, 'error': 'Control locked'}), 401
+
+    # The pages post form data; JSON bodies are still accepted
+    data = request.form or request.get_json(silent=True) or {}
     code = data.get('code')
     value = data.get('value')
 
     if not code or value is None:
-        return jsonify({'success': False, 'error': 'Missing code or value'})
+        return json_response({'success': False, 'error': 'Missing code or value'})
 
-    client = get_client()
-    success = client.control(DEVICE_CODE, code, value)
-    return jsonify({'success': success})
+    client = get_shared_client()
+    success = client is not None and client.control(DEVICE_CODE, code, value)
+    if success:
+        invalidate_status_cache()
+    return json_response({'success': success})
 
 @app.route('/api/db-stats')
 def api_db_stats():
     """Get database statistics"""
     stats = get_db_stats()
-    return jsonify(stats)
+    return json_response(stats)
 
 @app.route('/api/import-history')
 def api_import_history():
@@ -2961,16 +3880,19 @@ def api_import_history():
     imported = import_cloud_history(hours)
 
     # Get updated stats
-    conn = get_db_connection()
-    cur = conn.cursor()
-    if USE_POSTGRES:
-        cur.execute('SELECT COUNT(*), COUNT(DISTINCT parameter) FROM readings_raw')
-    else:
-        cur.execute('SELECT COUNT(*), COUNT(DISTINCT parameter) FROM readings_raw')
-    row = cur.fetchone()
-    conn.close()
+    conn = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        if USE_POSTGRES:
+            cur.execute('SELECT COUNT(*), COUNT(DISTINCT parameter) FROM readings_raw')
+        else:
+            cur.execute('SELECT COUNT(*), COUNT(DISTINCT parameter) FROM readings_raw')
+        row = cur.fetchone()
+    finally:
+        release_db_connection(conn)
 
-    return jsonify({
+    return json_response({
         'imported': imported,
         'total_readings': row[0],
         'unique_parameters': row[1]
@@ -2982,7 +3904,7 @@ def api_local_history():
     hours = request.args.get('hours', 168, type=int)
     readings = get_local_history(hours)
     stats = get_db_stats()
-    return jsonify({
+    return json_response({
         'readings': readings,
         'source': 'local_db',
         'db_stats': stats
@@ -2994,11 +3916,15 @@ ensure_admin_exists()
 
 # Auto-import history if database is nearly empty (works with gunicorn too)
 try:
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute('SELECT COUNT(*) FROM readings_raw')
-    raw_count = cur.fetchone()[0]
-    conn.close()
+    conn = None
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute('SELECT COUNT(*) FROM readings_raw')
+        raw_count = cur.fetchone()[0]
+    finally:
+        # Released before the import, which takes its own connection
+        release_db_connection(conn)
 
     if raw_count < 100:
         db_type = "PostgreSQL" if USE_POSTGRES else "SQLite (EPHEMERAL!)"
@@ -3017,11 +3943,14 @@ if __name__ == '__main__':
 
     # Check readings_raw count and auto-import if empty
     try:
-        conn = get_db_connection()
-        cur = conn.cursor()
-        cur.execute('SELECT COUNT(*) FROM readings_raw')
-        raw_count = cur.fetchone()[0]
-        conn.close()
+        conn = None
+        try:
+            conn = get_db_connection()
+            cur = conn.cursor()
+            cur.execute('SELECT COUNT(*) FROM readings_raw')
+            raw_count = cur.fetchone()[0]
+        finally:
+            release_db_connection(conn)
 
         if raw_count < 100:
             print(f"\nreadings_raw har bara {raw_count} rader - importerar 72h historik från cloud...")
@@ -4,10 +4,16 @@ Perifal Data Logger - Logs pump data to SQLite database
 Run this continuously to collect historical data
 """
 
+import atexit
+import logging
+import queue
+import signal
 import sqlite3
+import sys
+import threading
 import time
 import os
-from datetime import datetime
+from datetime import datetime, timezone
 from dotenv import load_dotenv
 from perifal_client import PerifalClient
 
@@ -15,6 +21,9 @@ load_dotenv()
 
 DB_PATH = os.path.join(os.path.dirname(__file__), 'perifal_history.db')
 
+# Per-tick lines go through logging so LOG_LEVEL=WARNING silences them
+log = logging.getLogger('perifal.logger')
+
 # Parameters to log
 LOG_PARAMS = [
     "Power", "Mode", "ModeState",
@@ -26,6 +35,38 @@ LOG_PARAMS = [
     "SG Status",
 ]
 
+# Readings go through a queue to a writer thread, so a slow commit never delays the
+# next fetch. It writes them in batches: one commit (and fsync) per flush.
+FLUSH_ROWS = 20
+FLUSH_SECONDS = 300
+# Readings kept for retry after a failed write; beyond this the oldest are dropped
+MAX_PENDING_ROWS = 500
+READING_QUEUE = queue.Queue(maxsize=64)
+dropped_readings = 0
+_writer_thread = None
+
+# Numeric columns t01_return .. curve_slope, in INSERT order; missing or empty values are 0
+NUMERIC_PARAMS = (
+    "T01", "T02", "T03", "T04", "T05", "T06", "T08", "T10", "T11", "T12", "T15",
+    "T33", "T34", "T35", "T36", "T37", "T38", "T39",
+    "R01", "M1 Hot Water Target", "M1 Heating Target",
+    "compensate_offset", "compensate_slope",
+)
+
+INSERT_READING_SQL = '''
+    INSERT INTO readings (
+        timestamp, power, mode, mode_state,
+        t01_return, t02_flow, t03_evaporator, t04_outdoor,
+        t05, t06, t08, t10, t11_hotwater, t12_compressor, t15,
+        t33_comp_freq, t34_runtime, t35_pressure_lp, t36_pressure_hp,
+        t37, t38, t39_power_kw,
+        r01_hw_target, m1_hw_target, m1_heat_target,
+        curve_offset, curve_slope,
+        silent_mode, fault1, sg_status,
+        cop_calculated, heat_power_kw, delta_t
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
 def init_db():
     """Create database tables if they don't exist"""
     conn = sqlite3.connect(DB_PATH)
@@ -110,61 +151,100 @@ def calculate_cop(data, flow_rate=25):
         return 0, 0, 0
 
 def log_reading(data):
-    """Log a single reading to database"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
+    """Queue a single reading for the writer thread"""
+    global dropped_readings
 
     cop, heat_power, delta_t = calculate_cop(data)
 
-    c.execute('''
-        INSERT INTO readings (
-            power, mode, mode_state,
-            t01_return, t02_flow, t03_evaporator, t04_outdoor,
-            t05, t06, t08, t10, t11_hotwater, t12_compressor, t15,
-            t33_comp_freq, t34_runtime, t35_pressure_lp, t36_pressure_hp,
-            t37, t38, t39_power_kw,
-            r01_hw_target, m1_hw_target, m1_heat_target,
-            curve_offset, curve_slope,
-            silent_mode, fault1, sg_status,
-            cop_calculated, heat_power_kw, delta_t
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (
+    row = (
+        # Stamped now, in the same UTC format as the column default, not at flush time
+        datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
         data.get('Power'),
         data.get('Mode'),
         data.get('ModeState'),
-        float(data.get('T01', 0) or 0),
-        float(data.get('T02', 0) or 0),
-        float(data.get('T03', 0) or 0),
-        float(data.get('T04', 0) or 0),
-        float(data.get('T05', 0) or 0),
-        float(data.get('T06', 0) or 0),
-        float(data.get('T08', 0) or 0),
-        float(data.get('T10', 0) or 0),
-        float(data.get('T11', 0) or 0),
-        float(data.get('T12', 0) or 0),
-        float(data.get('T15', 0) or 0),
-        float(data.get('T33', 0) or 0),
-        float(data.get('T34', 0) or 0),
-        float(data.get('T35', 0) or 0),
-        float(data.get('T36', 0) or 0),
-        float(data.get('T37', 0) or 0),
-        float(data.get('T38', 0) or 0),
-        float(data.get('T39', 0) or 0),
-        float(data.get('R01', 0) or 0),
-        float(data.get('M1 Hot Water Target', 0) or 0),
-        float(data.get('M1 Heating Target', 0) or 0),
-        float(data.get('compensate_offset', 0) or 0),
-        float(data.get('compensate_slope', 0) or 0),
+        *[float(v or 0) for v in map(data.get, NUMERIC_PARAMS)],
         data.get('hanControl'),
         data.get('Fault1'),
         data.get('SG Status'),
         cop,
         heat_power,
         delta_t
-    ))
+    )
 
-    conn.commit()
-    conn.close()
+    # If the writer has fallen far behind, drop the oldest reading rather than block
+    while True:
+        try:
+            READING_QUEUE.put_nowait(row)
+            return
+        except queue.Full:
+            try:
+                READING_QUEUE.get_nowait()
+                dropped_readings += 1
+                log.warning("Writer behind, dropped %d readings so far", dropped_readings)
+            except queue.Empty:
+                pass
+
+def reading_writer():
+    """Drain READING_QUEUE, writing every FLUSH_ROWS readings or FLUSH_SECONDS; None stops it"""
+    global dropped_readings
+    # One connection for the thread's lifetime; sqlite3 keeps INSERT_READING_SQL compiled on it
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    rows = []
+    # After a failed write, wait for the next deadline instead of retrying on every reading
+    retrying = False
+    deadline = time.monotonic() + FLUSH_SECONDS
+    while True:
+        try:
+            row = READING_QUEUE.get(timeout=max(deadline - time.monotonic(), 0))
+        except queue.Empty:
+            row = False
+        if row:
+            rows.append(row)
+            if len(rows) > MAX_PENDING_ROWS:
+                del rows[0]
+                dropped_readings += 1
+                log.warning("Write still failing, dropped %d readings so far", dropped_readings)
+
+        if row is None or (len(rows) >= FLUSH_ROWS and not retrying) or time.monotonic() >= deadline:
+            if rows:
+                try:
+                    conn.executemany(INSERT_READING_SQL, rows)
+                    conn.commit()
+                    rows = []
+                    retrying = False
+                except Exception as e:
+                    conn.rollback()
+                    retrying = True
+                    log.error("Write error, keeping %d readings for retry: %s", len(rows), e)
+            if row is None:
+                if rows:
+                    dropped_readings += len(rows)
+                    log.error("Stopping with %d unwritten readings, %d dropped in total", len(rows), dropped_readings)
+                conn.close()
+                return
+            deadline = time.monotonic() + FLUSH_SECONDS
+
+def start_writer():
+    """Start the writer thread; queued readings are flushed at exit and on SIGTERM"""
+    global _writer_thread
+    _writer_thread = threading.Thread(target=reading_writer, daemon=True)
+    _writer_thread.start()
+    atexit.register(stop_writer)
+    # atexit does not run when systemd or Docker stop us with SIGTERM
+    signal.signal(signal.SIGTERM, handle_sigterm)
+
+def handle_sigterm(signum, frame):
+    """Flush queued readings, then exit"""
+    log.info("SIGTERM received, writing queued readings")
+    stop_writer()
+    sys.exit(0)
+
+def stop_writer():
+    """Write what is queued and stop the writer thread"""
+    if _writer_thread is None or not _writer_thread.is_alive():
+        return
+    READING_QUEUE.put(None)
+    _writer_thread.join(timeout=30)
 
 def log_event(event_type, description, value_before=None, value_after=None):
     """Log an event (state change)"""
@@ -179,12 +259,20 @@ def log_event(event_type, description, value_before=None, value_after=None):
 
 def run_logger(interval=30):
     """Main logger loop"""
-    import sys
+    level = os.getenv('LOG_LEVEL', 'INFO').upper()
+    # A typo must not stop the logger; basicConfig raises on unknown names, and
+    # getLevelName() maps a known name to its number and anything else to a string
+    known_level = isinstance(logging.getLevelName(level), int)
+    logging.basicConfig(stream=sys.stdout, format='[%(asctime)s] %(message)s', datefmt='%H:%M:%S',
+                        level=level if known_level else logging.INFO)
+    if not known_level:
+        log.warning("Unknown LOG_LEVEL %r, using INFO", level)
     print(f"Starting Perifal Data Logger (interval: {interval}s)", flush=True)
     print(f"Database: {DB_PATH}", flush=True)
     print("-" * 50, flush=True)
 
     init_db()
+    start_writer()
 
     username = os.getenv("PERIFAL_USERNAME")
     password = os.getenv("PERIFAL_PASSWORD")
@@ -221,26 +309,27 @@ def run_logger(interval=30):
                 if last_power is not None and current_power != last_power:
                     event_desc = "Pump ON" if current_power == '1' else "Pump OFF"
                     log_event('power_change', event_desc, last_power, current_power)
-                    print(f"[{datetime.now().strftime('%H:%M:%S')}] EVENT: {event_desc}", flush=True)
+                    log.info("EVENT: %s", event_desc)
 
                 if last_mode is not None and current_mode != last_mode:
                     modes = {'1': 'VÄRME', '2': 'KYLA', '3': 'VV'}
                     event_desc = f"Mode: {modes.get(last_mode, last_mode)} → {modes.get(current_mode, current_mode)}"
                     log_event('mode_change', event_desc, last_mode, current_mode)
-                    print(f"[{datetime.now().strftime('%H:%M:%S')}] EVENT: {event_desc}", flush=True)
+                    log.info("EVENT: %s", event_desc)
 
                 last_power = current_power
                 last_mode = current_mode
 
-                # Print status every reading
-                cop, heat_power, delta_t = calculate_cop(data)
-                t04 = data.get('T04', '?')
-                t06 = data.get('T06', '?')
-                t39 = data.get('T39', '0')
-                print(f"[{datetime.now().strftime('%H:%M:%S')}] #{count} Ute:{t04}° Tank:{t06}° El:{t39}kW COP:{cop:.1f}", flush=True)
+                # Status line every reading, skipped entirely when INFO is off
+                if log.isEnabledFor(logging.INFO):
+                    cop, heat_power, delta_t = calculate_cop(data)
+                    t04 = data.get('T04', '?')
+                    t06 = data.get('T06', '?')
+                    t39 = data.get('T39', '0')
+                    log.info("#%d Ute:%s° Tank:%s° El:%skW COP:%.1f", count, t04, t06, t39, cop)
 
         except Exception as e:
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] Error: {e}", flush=True)
+            log.error("Error: %s", e)
             # Re-login on error
             try:
                 client.login()
@@ -250,6 +339,5 @@ def run_logger(interval=30):
         time.sleep(interval)
 
 if __name__ == '__main__':
-    import sys
     interval = int(sys.argv[1]) if len(sys.argv) > 1 else 30
     run_logger(interval)
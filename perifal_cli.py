@@ -4,10 +4,19 @@ Perifal LV-418 CLI - Command line tool for heat pump control
 """
 
 import argparse
+import atexit
+import json
+import logging
 import os
 import sys
-from dotenv import load_dotenv
-from perifal_client import PerifalClient
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+# requests (via perifal_client) and dotenv are imported in main() after
+# argument parsing, so --help and usage errors don't pay for loading them
+if TYPE_CHECKING:
+    from perifal_client import PerifalClient
 
 # Important parameter codes - mapped sensors:
 # T01 = Retur (ingående vatten till pump)
@@ -21,55 +30,101 @@ SETTINGS = ["Power", "Mode", "ModeState", "M1 Mode", "M1 Heating Target", "M1 Ho
             "R01", "R02", "R03", "compensate_slope", "compensate_offset"]
 FAULTS = ["Fault1", "Fault5", "Fault6"]
 
-ALL_CODES = TEMP_SENSORS + SETTINGS + FAULTS
+ALL_CODES = tuple(TEMP_SENSORS + SETTINGS + FAULTS)
+
+# Token from the last run; reused so back-to-back commands skip the login request.
+# An expired one is answered with -100 and the client logs in again by itself.
+TOKEN_FILE = os.path.join(os.path.expanduser("~"), ".cache", "perifal", "token.json")
+TOKEN_MAX_AGE = 12 * 3600
+
+# The cloud refreshes readings only every so often; a faster watch reuses the last
+# answer for this many seconds instead of asking again
+CACHE_TTL = 15
+
+# Status box, written in one go by print_status()
+STATUS_FIELDS = {
+    "t04": "T04", "t02": "T02", "t01": "T01", "t11": "T11", "t03": "T03", "t12": "T12",
+    "offset": "compensate_offset", "slope": "compensate_slope",
+    "heat_target": "M1 Heating Target", "hw_target_m1": "M1 Hot Water Target", "hw_target_r01": "R01",
+}
+STATUS_TEMPLATE = """
+╔══════════════════════════════════════════════╗
+║         PERIFAL LV-418 STATUS                ║
+╠══════════════════════════════════════════════╣
+║  Status: {online:<10} Power: {power:<5} Fault: {fault:<4}║
+╠══════════════════════════════════════════════╣
+║  TEMPERATURER                                ║
+║    Utomhus (T04):        {t04:>6}°C           ║
+║    Framledning (T02):    {t02:>6}°C           ║
+║    Retur (T01):          {t01:>6}°C           ║
+║    Varmvatten (T11):     {t11:>6}°C           ║
+║    Förångare (T03):      {t03:>6}°C           ║
+║    Kompressor (T12):     {t12:>6}°C           ║
+╠══════════════════════════════════════════════╣
+║  INSTÄLLNINGAR                               ║
+║    Värmekurva offset:    {offset:>6}             ║
+║    Värmekurva lutning:   {slope:>6}             ║
+║    Värme börvärde:       {heat_target:>6}°C           ║
+║    VV börvärde (M1):     {hw_target_m1:>6}°C           ║
+║    VV börvärde (R01):    {hw_target_r01:>6}°C           ║
+╚══════════════════════════════════════════════╝
+"""
 
 
-def print_status(client: PerifalClient, device_code: str):
+def print_status(client: "PerifalClient", device_code: str):
     """Print current pump status"""
-    status = client.get_device_status(device_code)
-    params = client.get_all_parameters(device_code, ALL_CODES)
-
-    print("\n╔══════════════════════════════════════════════╗")
-    print("║         PERIFAL LV-418 STATUS                ║")
-    print("╠══════════════════════════════════════════════╣")
-
-    # Online status
-    online = status.get("status", "UNKNOWN")
-    fault = status.get("is_fault", False)
-    power = params.get("Power", "?")
-
-    print(f"║  Status: {online:<10} Power: {'ON' if power == '1' else 'OFF':<5} Fault: {'YES' if fault else 'NO':<4}║")
-    print("╠══════════════════════════════════════════════╣")
-
-    # Temperatures
-    print("║  TEMPERATURER                                ║")
-    print(f"║    Utomhus (T04):        {params.get('T04', '?'):>6}°C           ║")
-    print(f"║    Framledning (T02):    {params.get('T02', '?'):>6}°C           ║")
-    print(f"║    Retur (T01):          {params.get('T01', '?'):>6}°C           ║")
-    print(f"║    Varmvatten (T11):     {params.get('T11', '?'):>6}°C           ║")
-    print(f"║    Förångare (T03):      {params.get('T03', '?'):>6}°C           ║")
-    print(f"║    Kompressor (T12):     {params.get('T12', '?'):>6}°C           ║")
-    print("╠══════════════════════════════════════════════╣")
-
-    # Settings
-    print("║  INSTÄLLNINGAR                               ║")
-    print(f"║    Värmekurva offset:    {params.get('compensate_offset', '?'):>6}             ║")
-    print(f"║    Värmekurva lutning:   {params.get('compensate_slope', '?'):>6}             ║")
-    print(f"║    Värme börvärde:       {params.get('M1 Heating Target', '?'):>6}°C           ║")
-    print(f"║    VV börvärde (M1):     {params.get('M1 Hot Water Target', '?'):>6}°C           ║")
-    print(f"║    VV börvärde (R01):    {params.get('R01', '?'):>6}°C           ║")
-    print("╚══════════════════════════════════════════════╝")
+    # Independent requests; fetch the status alongside the parameters
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        status_future = executor.submit(client.get_device_status, device_code)
+        params = client.get_all_parameters(device_code, ALL_CODES)
+        status = status_future.result()
+
+    view = {name: params.get(code, "?") for name, code in STATUS_FIELDS.items()}
+    view["online"] = status.get("status", "UNKNOWN")
+    view["power"] = "ON" if params.get("Power", "?") == "1" else "OFF"
+    view["fault"] = "YES" if status.get("is_fault", False) else "NO"
+
+    sys.stdout.write(STATUS_TEMPLATE.format_map(view))
+
+
+def load_token(client: "PerifalClient") -> bool:
+    """Give the client a recent saved token for its user; True if one was loaded"""
+    try:
+        with open(TOKEN_FILE) as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        return False
+    if saved.get("username") != client.username or time.time() - saved.get("ts", 0) > TOKEN_MAX_AGE:
+        return False
+    client.token = saved.get("token")
+    client.user_id = saved.get("user_id")
+    return bool(client.token)
+
+
+def save_token(client: "PerifalClient", loaded_token: str = None):
+    """Save the client's token for the next run, if this run obtained a new one"""
+    if not client.token or client.token == loaded_token:
+        return
+    try:
+        os.makedirs(os.path.dirname(TOKEN_FILE), exist_ok=True)
+        fd = os.open(TOKEN_FILE, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump({"username": client.username, "token": client.token,
+                       "user_id": client.user_id, "ts": time.time()}, f)
+    except OSError:
+        pass
 
 
 def main():
-    load_dotenv()
-
     parser = argparse.ArgumentParser(description="Perifal LV-418 Heat Pump CLI")
     subparsers = parser.add_subparsers(dest="command", help="Commands")
 
     # Status command
     subparsers.add_parser("status", help="Show pump status")
 
+    watch_parser = subparsers.add_parser("watch", help="Show pump status repeatedly")
+    watch_parser.add_argument("--interval", type=float, default=30, help=f"Seconds between updates (default 30; readings are refetched at most every {CACHE_TTL} s)")
+
     # Get parameter
     get_parser = subparsers.add_parser("get", help="Get parameter value")
     get_parser.add_argument("code", help="Parameter code (e.g., T01, R01)")
@@ -92,6 +147,13 @@ def main():
 
     args = parser.parse_args()
 
+    from dotenv import load_dotenv
+    from perifal_client import PerifalClient
+
+    load_dotenv()
+    # The client reports logins and control results through logging
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO, format="%(message)s")
+
     # Get credentials
     username = os.getenv("PERIFAL_USERNAME")
     password = os.getenv("PERIFAL_PASSWORD")
@@ -102,15 +164,28 @@ def main():
         sys.exit(1)
 
     # Connect
-    client = PerifalClient(username, password)
-    if not client.login():
-        print("Login failed!")
-        sys.exit(1)
+    client = PerifalClient(username, password, cache_ttl=CACHE_TTL)
+    if load_token(client):
+        atexit.register(save_token, client, client.token)
+    else:
+        if not client.login():
+            print("Login failed!")
+            sys.exit(1)
+        atexit.register(save_token, client)
 
     # Execute command
     if args.command == "status" or args.command is None:
         print_status(client, device_code)
 
+    elif args.command == "watch":
+        # One client and login for the whole session; Ctrl+C stops it
+        try:
+            while True:
+                print_status(client, device_code)
+                time.sleep(args.interval)
+        except KeyboardInterrupt:
+            pass
+
     elif args.command == "get":
         params = client.get_all_parameters(device_code, [args.code])
         value = params.get(args.code, "NOT FOUND")
@@ -130,11 +205,15 @@ def main():
         client.set_power(device_code, False)
 
     elif args.command == "curve":
+        # Offset and slope go out together in one control request
+        changes = []
         if args.offset is not None:
-            client.set_curve_offset(device_code, args.offset)
+            changes.append(("compensate_offset", str(args.offset)))
         if args.slope is not None:
-            client.set_curve_slope(device_code, args.slope)
-        if args.offset is None and args.slope is None:
+            changes.append(("compensate_slope", str(args.slope)))
+        if changes:
+            client.control_many(device_code, changes)
+        else:
             params = client.get_all_parameters(device_code, ["compensate_offset", "compensate_slope"])
             print(f"Offset: {params.get('compensate_offset')}")
             print(f"Slope:  {params.get('compensate_slope')}")
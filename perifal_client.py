@@ -20,8 +20,14 @@ Control parameters:
 """
 
 import hashlib
+import logging
+import threading
+import time
+import orjson
 import requests
-from typing import Optional
+from requests.adapters import HTTPAdapter
+from typing import List, Optional, Tuple
+from urllib3.util.retry import Retry
 
 # Sensor code to Swedish name mapping
 SENSOR_NAMES = {
@@ -33,13 +39,32 @@ SENSOR_NAMES = {
     "T12": "Kompressor",
 }
 
+# Diagnostics; silent unless the application configures logging
+log = logging.getLogger("perifal")
+
+# Requested by get_all_parameters() when no codes are given
+DEFAULT_CODES = (
+    "Power", "Mode", "ModeState",
+    "T01", "T02", "T03", "T04", "T05", "T06", "T08", "T10", "T11", "T12",
+    "R01", "R02", "R03",
+    "M1 Heating Target", "M1 Hot Water Target", "M1 Mode",
+    "compensate_slope", "compensate_offset",
+    "Fault1", "Fault5", "Fault6",
+)
+
 
 class PerifalClient:
     BASE_URL = "https://cloud.linked-go.com:449/crmservice/api"
+    # Threads that hit an expired token together share one login
+    LOGIN_MIN_INTERVAL = 2.0
 
-    def __init__(self, username: str, password: str):
+    def __init__(self, username: str, password: str, cache_ttl: float = 0):
         self.username = username
         self.password = password
+        # Seconds get_all_parameters() answers repeat requests from memory; 0 disables
+        self.cache_ttl = cache_ttl
+        self._cache = {}  # (device_code, codes) -> (fetched, values)
+        self._body_cache = {}  # (device_code, codes) -> encoded getDataByCode body
         self.token: Optional[str] = None
         self.user_id: Optional[str] = None
         self.session = requests.Session()
@@ -47,49 +72,63 @@ class PerifalClient:
             "Content-Type": "application/json; charset=utf-8",
             "User-Agent": "okhttp/5.1.0",
         })
+        # Keep-alive connections for concurrent callers, and retry transient failures.
+        # Every call is a read or sets an absolute value, so POSTs are safe to repeat.
+        retry = Retry(total=3, backoff_factor=0.3, status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=None, raise_on_status=False)
+        self.session.mount("https://", HTTPAdapter(pool_connections=10, pool_maxsize=20, max_retries=retry))
+        self._login_lock = threading.Lock()
+        self._last_login = float("-inf")
+        # Built once; re-logins on token expiry just post it again
+        self._login_body = {
+            "userName": username,
+            "password": self._md5_hash(password),
+            "loginSource": "Android",
+            "type": "2",
+            "areaCode": "sv",
+            "appId": "16"
+        }
 
     def _md5_hash(self, text: str) -> str:
         """Hash password with MD5"""
         return hashlib.md5(text.encode()).hexdigest()
 
-    def _request(self, method: str, endpoint: str, json_data: dict = None) -> dict:
-        """Make API request with token header"""
+    def _request(self, method: str, endpoint: str, json_data: dict = None, body: bytes = None) -> dict:
+        """Make API request with token header; `body` is json_data already encoded"""
         url = f"{self.BASE_URL}{endpoint}?lang=sv"
         headers = {}
         if self.token:
             headers["x-token"] = self.token
 
+        # Encoded and decoded with orjson; the session already sends the JSON Content-Type
         response = self.session.request(
             method=method,
             url=url,
-            json=json_data,
+            data=body if json_data is None else orjson.dumps(json_data),
             headers=headers
         )
         response.raise_for_status()
-        return response.json()
+        return orjson.loads(response.content)
 
     def login(self) -> bool:
-        """Login and get token"""
-        data = {
-            "userName": self.username,
-            "password": self._md5_hash(self.password),
-            "loginSource": "Android",
-            "type": "2",
-            "areaCode": "sv",
-            "appId": "16"
-        }
+        """Login and get token; a login within LOGIN_MIN_INTERVAL reuses that outcome"""
+        with self._login_lock:
+            if time.monotonic() - self._last_login < self.LOGIN_MIN_INTERVAL:
+                return self.token is not None
+            self._last_login = time.monotonic()
 
-        result = self._request("POST", "/app/user/login", data)
+            result = self._request("POST", "/app/user/login", self._login_body)
 
-        if result.get("error_code") == "0":
-            obj = result.get("objectResult", {})
-            self.token = obj.get("x-token")
-            self.user_id = obj.get("userId")
-            print(f"Login OK - User ID: {self.user_id}")
-            return True
-        else:
-            print(f"Login failed: {result.get('error_msg')}")
-            return False
+            if result.get("error_code") == "0":
+                obj = result.get("objectResult", {})
+                self.token = obj.get("x-token")
+                self.user_id = obj.get("userId")
+                log.info("Login OK - User ID: %s", self.user_id)
+                return True
+            else:
+                self.token = None
+                log.error("Login failed: %s", result.get('error_msg'))
+                return False
 
     def get_device_list(self) -> list:
         """Get list of devices"""
@@ -108,6 +147,12 @@ class PerifalClient:
         data = {"deviceCode": device_code}
         result = self._request("POST", "/app/device/getDeviceStatus", data)
 
+        if result.get("error_code") == "-100":
+            # Token expired - re-login and retry
+            log.info("Token expired, re-logging in...")
+            if self.login():
+                result = self._request("POST", "/app/device/getDeviceStatus", data)
+
         if result.get("error_code") == "0":
             return result.get("objectResult", {})
         return {}
@@ -116,58 +161,77 @@ class PerifalClient:
         """Get device parameters by code"""
         # If no codes specified, request common ones
         if codes is None:
-            codes = [
-                "Power", "Mode", "ModeState",
-                "T01", "T02", "T03", "T04", "T05", "T06", "T08", "T10", "T11", "T12",
-                "R01", "R02", "R03",
-                "M1 Heating Target", "M1 Hot Water Target", "M1 Mode",
-                "compensate_slope", "compensate_offset",
-                "Fault1", "Fault5", "Fault6"
-            ]
-
-        data = {
-            "deviceCode": device_code,
-            "protocalCodes": codes  # Note: API uses "protocal" (typo in their API)
-        }
+            codes = DEFAULT_CODES
+
+        key = (device_code, tuple(codes))
+        if self.cache_ttl:
+            entry = self._cache.get(key)
+            if entry and time.monotonic() - entry[0] < self.cache_ttl:
+                return dict(entry[1])
+
+        # Pollers ask for the same codes every time; encode that body once
+        body = self._body_cache.get(key)
+        if body is None:
+            body = self._body_cache[key] = orjson.dumps({
+                "deviceCode": device_code,
+                "protocalCodes": codes  # Note: API uses "protocal" (typo in their API)
+            })
 
         try:
-            result = self._request("POST", "/app/device/getDataByCode", data)
+            result = self._request("POST", "/app/device/getDataByCode", body=body)
 
             if result.get("error_code") == "0":
                 params = result.get("objectResult", [])
                 # Convert to dict for easier access
-                return {p["code"]: p["value"] for p in params}
+                values = {p["code"]: p["value"] for p in params}
+                if self.cache_ttl:
+                    self._cache[key] = (time.monotonic(), values)
+                    return dict(values)
+                return values
             elif result.get("error_code") == "-100" and retry_login:
                 # Token expired - re-login and retry
-                print("Token expired, re-logging in...", flush=True)
+                log.info("Token expired, re-logging in...")
                 if self.login():
                     return self.get_all_parameters(device_code, codes, retry_login=False)
                 return {}
             else:
                 error_msg = result.get("error_msg", "Unknown error")
                 error_code = result.get("error_code", "?")
-                print(f"API error {error_code}: {error_msg}", flush=True)
+                log.error("API error %s: %s", error_code, error_msg)
                 return {}
         except Exception as e:
-            print(f"Request error: {e}", flush=True)
+            log.error("Request error: %s", e)
             return {}
 
     def control(self, device_code: str, protocol_code: str, value: str) -> bool:
         """Send control command to device"""
+        return self.control_many(device_code, [(protocol_code, value)])
+
+    def control_many(self, device_code: str, items: List[Tuple[str, str]]) -> bool:
+        """Send several control commands to device in one request"""
         data = {
             "param": [{
                 "deviceCode": device_code,
                 "protocolCode": protocol_code,
                 "value": value
-            }]
+            } for protocol_code, value in items]
         }
         result = self._request("POST", "/app/device/control", data)
 
+        if result.get("error_code") == "-100":
+            # Token expired - re-login and retry
+            log.info("Token expired, re-logging in...")
+            if self.login():
+                result = self._request("POST", "/app/device/control", data)
+
+        changes = ", ".join(f"{protocol_code} = {value}" for protocol_code, value in items)
         if result.get("error_code") == "0":
-            print(f"Control OK: {protocol_code} = {value}")
+            # Cached readings may predate the change
+            self._cache.clear()
+            log.info("Control OK: %s", changes)
             return True
         else:
-            print(f"Control failed: {result.get('error_msg')}")
+            log.error("Control failed: %s", result.get('error_msg'))
             return False
 
     def set_power(self, device_code: str, on: bool) -> bool:
@@ -221,16 +285,16 @@ class PerifalClient:
                 return result.get("objectResult", [])
             elif result.get("error_code") == "-100":
                 # Token expired - re-login and retry
-                print("Token expired, re-logging in...", flush=True)
+                log.info("Token expired, re-logging in...")
                 if self.login():
                     result = self._request("POST", "/device/snapshot/listCollectData", data)
                     if result.get("error_code") == "0":
                         return result.get("objectResult", [])
             else:
-                print(f"History API error: {result.get('error_msg')}", flush=True)
+                log.error("History API error: %s", result.get('error_msg'))
             return []
         except Exception as e:
-            print(f"History request error: {e}", flush=True)
+            log.error("History request error: %s", e)
             return []
 
 
@@ -239,6 +303,7 @@ if __name__ == "__main__":
     from dotenv import load_dotenv
 
     load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
 
     username = os.getenv("PERIFAL_USERNAME")
     password = os.getenv("PERIFAL_PASSWORD")